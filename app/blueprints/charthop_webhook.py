@@ -1,9 +1,46 @@
+import logging
+from functools import lru_cache
+
 from flask import Blueprint, request
 
 from app.services.job_sync import sync_job_create, sync_job_update
 from app.tasks.charthop_dispatcher import enqueue_charthop_task
 
 bp_ch = Blueprint("charthop_webhook", __name__)
+logger = logging.getLogger(__name__)
+
+# Variantes de nombre que ChartHop usa para cada campo del evento
+_EVT_TYPE_KEYS = ("type", "eventType", "event_type")
+_EVT_ENTITY_KEYS = ("entityType", "entitytype", "entity_type")
+_EVT_ENTITY_ID_KEYS = ("entityId", "entityid", "entity_id")
+
+
+def _evt_get(evt: dict, keys: tuple) -> object:
+    """Primer valor no vacío entre las variantes de clave (sin copiar el dict)."""
+    for key in keys:
+        value = evt.get(key)
+        if value:
+            return value
+    return None
+
+
+def _evt_fields(evt: dict) -> tuple:
+    """(tipo en minúsculas, entidad en minúsculas, entity_id) del evento."""
+    evtype_raw = str(_evt_get(evt, _EVT_TYPE_KEYS) or "").lower()
+    entity = str(_evt_get(evt, _EVT_ENTITY_KEYS) or "").lower()
+    entity_id = str(_evt_get(evt, _EVT_ENTITY_ID_KEYS) or "")
+    return evtype_raw, entity, entity_id
+
+
+@lru_cache(maxsize=128)
+def _evt_type_parts(evtype_raw: str) -> tuple:
+    """(entidad, acción) derivadas del tipo de evento; ChartHop usa pocos tipos."""
+    evtype = evtype_raw.replace("-", ".")
+    type_parts = [part for part in evtype.split(".") if part]
+    type_entity = type_parts[0] if len(type_parts) >= 2 else ""
+    action = type_parts[-1] if type_parts else evtype
+    return type_entity, action
+
 
 @bp_ch.route("/events/talent-search", methods=["GET", "POST"])
 def ch_talent_search_webhook():
@@ -12,14 +49,14 @@ def ch_talent_search_webhook():
         return "ChartHop talent-search webhook up", 200
 
     evt = request.get_json(force=True, silent=True) or {}
-    evtype_raw = (evt.get("type") or evt.get("eventType") or evt.get("event_type") or "").lower()
-    entity = (evt.get("entityType") or evt.get("entitytype") or evt.get("entity_type") or "").lower()
-    entity_id = str(evt.get("entityId") or evt.get("entityid") or evt.get("entity_id") or "")
+    evtype_raw, entity, entity_id = _evt_fields(evt)
 
-    print(f"CH talent-search evt: type={evtype_raw} entity={entity} entity_id={entity_id}")
+    logger.info(
+        "CH talent-search evt: type=%s entity=%s entity_id=%s", evtype_raw, entity, entity_id
+    )
 
     # Log the full event for debugging
-    print(f"Talent-search event payload: {evt}")
+    logger.debug("Talent-search event payload: %s", evt)
 
     # Return 200 to acknowledge receipt
     return "", 200
@@ -31,18 +68,14 @@ def ch_webhook():
         return "ChartHop webhook up", 200
 
     evt = request.get_json(force=True, silent=True) or {}
-    evtype_raw = (evt.get("type") or evt.get("eventType") or evt.get("event_type") or "").lower()
-    evtype = evtype_raw.replace("-", ".")
-    entity = (evt.get("entityType") or evt.get("entitytype") or evt.get("entity_type") or "").lower()
-    entity_id = str(evt.get("entityId") or evt.get("entityid") or evt.get("entity_id") or "")
-
-    type_parts = [part for part in evtype.split(".") if part]
-    type_entity = type_parts[0] if len(type_parts) >= 2 else ""
-    action = type_parts[-1] if type_parts else evtype
+    evtype_raw, entity, entity_id = _evt_fields(evt)
+    type_entity, action = _evt_type_parts(evtype_raw)
     if not entity and type_entity:
         entity = type_entity
 
-    print(f"CH evt: type={evtype_raw} entity={entity} entity_id={entity_id} action={action}")
+    logger.info(
+        "CH evt: type=%s entity=%s entity_id=%s action=%s", evtype_raw, entity, entity_id, action
+    )
     is_job = entity in ("job", "jobs")
     is_timeoff = entity in ("timeoff", "time off", "time-off") or type_entity == "timeoff"
     is_person = entity in ("person", "people") or type_entity == "person"
@@ -56,22 +89,22 @@ def ch_webhook():
             # Determinar el tipo de tarea según la acción
             if is_delete:
                 task = enqueue_charthop_task("timeoff_delete", entity_id)
-                print(f"Queued ChartHop timeoff delete task: {task}")
+                logger.info("Queued ChartHop timeoff delete task: %s", task)
             else:
                 # Create o Update se manejan con la misma función (auto-detecta)
                 task = enqueue_charthop_task("timeoff", entity_id)
-                print(f"Queued ChartHop timeoff sync task: {task}")
+                logger.info("Queued ChartHop timeoff sync task: %s", task)
         except Exception as exc:  # pragma: no cover - defensive logging
-            print(f"Failed to enqueue timeoff task: {exc}")
+            logger.error("Failed to enqueue timeoff task: %s", exc)
             return "", 500
         return "", 200
 
     if is_person and entity_id and (is_create or is_update):
         try:
             task = enqueue_charthop_task("person", entity_id)
-            print(f"Queued ChartHop person task: {task}")
+            logger.info("Queued ChartHop person task: %s", task)
         except Exception as exc:  # pragma: no cover - defensive logging
-            print(f"Failed to enqueue person task: {exc}")
+            logger.error("Failed to enqueue person task: %s", exc)
             return "", 500
         return "", 200
 
@@ -87,12 +120,12 @@ def ch_webhook():
     if is_compensation and entity_id:
         try:
             task_calc = enqueue_charthop_task("ctc_recalculate", entity_id)
-            print(f"Queued ChartHop CTC RECALCULATE task: {task_calc}")
+            logger.info("Queued ChartHop CTC RECALCULATE task: %s", task_calc)
 
             task_sync = enqueue_charthop_task("compensation", entity_id)
-            print(f"Queued ChartHop compensation task: {task_sync}")
+            logger.info("Queued ChartHop compensation task: %s", task_sync)
         except Exception as exc:  # pragma: no cover - defensive logging
-            print(f"Failed to enqueue compensation task(s): {exc}")
+            logger.error("Failed to enqueue compensation task(s): %s", exc)
             return "", 500
         return "", 200
 
@@ -101,10 +134,24 @@ def ch_webhook():
 
     if is_create:
         if not entity_id:
-            print("CH job create: missing entity_id"); return "", 200
-        sync_job_create(entity_id)
+            logger.warning("CH job create: missing entity_id"); return "", 200
+        _enqueue_job_task("job_create", entity_id, sync_job_create)
 
     if is_update and entity_id:
-        sync_job_update(entity_id)
+        _enqueue_job_task("job_update", entity_id, sync_job_update)
     return "", 200
 
+
+def _enqueue_job_task(kind: str, job_id: str, fallback) -> None:
+    """
+    Encola la sincronización CH -> TT de un job en Cloud Tasks para responder al
+    webhook sin esperar las llamadas a ChartHop/Teamtailor. Si no se puede
+    encolar (p. ej. Cloud Tasks sin configurar) se ejecuta en línea.
+    """
+    try:
+        task = enqueue_charthop_task(kind, job_id)
+        logger.info("Queued ChartHop %s task: %s", kind, task)
+    except Exception as exc:  # pragma: no cover - defensive logging
+        logger.warning("Failed to enqueue %s task, running inline: %s", kind, exc)
+        fallback(job_id)
+
@@ -1,9 +1,33 @@
+import logging
+import threading
+
 from flask import Blueprint, request
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from app.utils import _json
 from app.utils.config import tt_verify_signature
 from app.clients.teamtailor import tt_fetch_application
 from app.services.hire import process_hired_application
+from app.utils.rate_limiter import TimedCache
 
 bp_tt = Blueprint("teamtailor_webhook", __name__)
+logger = logging.getLogger(__name__)
+
+# Teamtailor reintenta las entregas: una aplicación contratada que ya se procesó
+# (o se está procesando) en los últimos minutos no vuelve a generar correo ni a
+# llamar a ChartHop/Runn. Es por proceso; con varias instancias sigue pudiendo
+# colarse un duplicado, igual que antes.
+_RECENT_HIRES = TimedCache(ttl_seconds=600)
+_RECENT_HIRES_LOCK = threading.Lock()
+
+
+def _claim_hire(rid: str) -> bool:
+    with _RECENT_HIRES_LOCK:
+        if _RECENT_HIRES.get(rid) is not None:
+            return False
+        _RECENT_HIRES.cleanup_expired()
+        _RECENT_HIRES.set(rid, True)
+        return True
+
 
 @bp_tt.route("/webhooks/teamtailor", methods=["POST"])
 def tt_webhook():
@@ -13,24 +37,48 @@ def tt_webhook():
         sig = request.headers.get("Teamtailor-Signature", "")
 
         if not tt_verify_signature(rid, sig):
-            print(f"TT sig fail rid={rid}")
+            logger.warning("TT sig fail rid=%s", rid)
             return "", 200
-        print(f"TT sig ok rid={rid}")
+        logger.debug("TT sig ok rid=%s", rid)
 
         if not rid:
-            print("TT webhook: missing resource_id"); return "", 200
+            logger.warning("TT webhook: missing resource_id"); return "", 200
 
-        resp = tt_fetch_application(rid)
-        print("TT fetch status:", resp.status_code)
-        if not resp.ok:
+        if not _claim_hire(rid):
+            logger.info("TT webhook: duplicate delivery rid=%s, skipped", rid)
             return "", 200
 
-        body = resp.json() or {}
-        result = process_hired_application(rid, body)
-        print("TT hire result:", result)
-        return "", 200
+        keep_claim = False
+        try:
+            resp = tt_fetch_application(rid)
+            logger.info("TT fetch status: %s", resp.status_code)
+            if not resp.ok:
+                # 429/5xx ya agotaron los reintentos de la sesión: 503 para que
+                # Teamtailor reentregue más tarde en vez de perder la contratación.
+                retryable = resp.status_code == 429 or resp.status_code >= 500
+                return "", 503 if retryable else 200
+
+            body = _json.loads(resp.content) or {}
+            result = process_hired_application(
+                rid, body, on_import_failed=lambda: _RECENT_HIRES.delete(rid)
+            )
+            # Un import que sigue en curso conserva la reserva (una reentrega
+            # importaría a la persona de nuevo); si termina con error, el
+            # callback la libera.
+            keep_claim = bool(result.get("processed") or result.get("chartHopPending"))
+            logger.info("TT hire result: %s", result)
+            return "", 200
+        finally:
+            # Si el import a ChartHop falló o la aplicación aún no estaba
+            # contratada, la siguiente entrega se reintenta.
+            if not keep_claim:
+                _RECENT_HIRES.delete(rid)
 
+    except (RequestsConnectionError, Timeout) as e:
+        # Falla de red hacia Teamtailor antes de escribir en ChartHop/Runn
+        logger.error("tt_webhook upstream unavailable: %r", e)
+        return "", 503
     except Exception as e:
-        print("tt_webhook error:", repr(e))
+        logger.error("tt_webhook error: %r", e)
         return "", 200
 
@@ -2,21 +2,27 @@ from __future__ import annotations
 
 import csv
 import io
-import json
-import hashlib
 import logging
 import os
+import random
+import re
+import threading
 import time
 import datetime as dt
 from collections import OrderedDict
-from typing import Any, Dict, Iterable, Iterator, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from operator import itemgetter
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
 
 from requests import Session
 from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError as RequestsConnectionError
 from requests.exceptions import HTTPError, Timeout, SSLError
 
+from app.utils import _json
 from app.utils import config as _config
+from app.utils.rate_limiter import TimedCache
 
 AUTO_ASSIGN_WORK_EMAIL = _config.AUTO_ASSIGN_WORK_EMAIL
 CH_API = _config.CH_API
@@ -34,6 +40,8 @@ CTC_FIELD_CODES = [
     for code in os.getenv("CH_JOB_CTC_CODES", "Costtocompany,CostToCompany").split(",")
     if code.strip()
 ]
+# Proyección `fields` para leer el CTC de un job (fija desde el import)
+_CTC_FIELDS = ",".join(CTC_FIELD_CODES)
 
 logger = logging.getLogger(__name__)
 
@@ -41,19 +49,52 @@ logger = logging.getLogger(__name__)
 #   HTTP helpers
 # =========================
 
-def _new_session() -> Session:
+def _new_session(pool_maxsize: int = 8) -> Session:
     s = Session()
     s.headers.update(ch_headers())
-    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
     s.mount("https://", adapter)
     s.mount("http://", adapter)
     return s
 
 
+# Sesión compartida por todo el proceso: reutiliza las conexiones keep-alive
+# (evita un handshake TLS por llamada). Los reintentos los maneja _get_json.
+_SESSION = _new_session(pool_maxsize=20)
+
+# Lookups independientes (p. ej. employment por jobId) se resuelven en paralelo.
+# Menos workers que conexiones del pool para no bloquear otras llamadas.
+_LOOKUP_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ch-lookup")
+
+# Prefetch de la página siguiente en listados paginados con cursor (ver
+# ch_iter_people_v2). Pool aparte para no competir con los lookups.
+_PAGE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ch-page")
+
+
+# Tope para Retry-After: un valor enorme (p. ej. 3600) no debe dejar un hilo de
+# los pools o de un request dormido por horas en cada reintento.
+_MAX_RETRY_AFTER_SECONDS = 60.0
+
+
+def _retry_delay(attempt: int, response=None) -> float:
+    """Backoff exponencial con jitter (evita reintentos sincronizados entre hilos);
+    un Retry-After en segundos, si viene, actúa como mínimo (hasta el tope)."""
+    delay = min(2 ** (attempt - 1), 30) * random.uniform(0.5, 1.5)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+        else:
+            delay = max(delay, min(retry_after, _MAX_RETRY_AFTER_SECONDS))
+    return delay
+
+
 def _get_json(session: Session, url: str, params: Dict[str, str], max_retries: int = 5) -> Dict:
     attempt = 0
     last_exc: Optional[Exception] = None
     while True:
+        r = None
         try:
             r = session.get(url, params=params, timeout=HTTP_TIMEOUT)
         except (RequestsConnectionError, Timeout, SSLError) as exc:
@@ -67,51 +108,62 @@ def _get_json(session: Session, url: str, params: Dict[str, str], max_retries: i
                 try:
                     r.raise_for_status()
                 except HTTPError as exc:
+                    if r.status_code < 500:
+                        # 4xx (salvo 429) no se arregla reintentando; se propaga
+                        # el HTTPError para que quien llama pueda tratar el 404.
+                        raise
                     attempt += 1
                     last_exc = exc
                 else:
                     try:
-                        return r.json() or {}
+                        return _json.loads(r.content) or {}
                     except ValueError as exc:
                         attempt += 1
                         last_exc = exc
         if attempt > max_retries:
             raise RuntimeError(f"ChartHop request failed after retries: {last_exc}") from last_exc
-        time.sleep(min(2 ** (attempt - 1), 30))
+        time.sleep(_retry_delay(attempt, r))
 
 
-def ch_get_paginated(url: str, params: Dict[str, object]) -> List[Dict]:
-    session = _new_session()
-    results: List[Dict] = []
+def ch_iter_paginated(
+    url: str,
+    params: Dict[str, object],
+    cursor_param: str = "offset",
+) -> Iterator[Dict]:
+    """
+    Itera los registros de un endpoint paginado, una página en memoria a la vez.
+    El token `next` se reenvía en `cursor_param` (v1 usa `offset`, v2 usa `from`).
+    """
+    session = _SESSION
     offset: Optional[str] = None
-    try:
-        while True:
-            query: Dict[str, object] = {}
-            for key, value in params.items():
-                if value is None:
-                    continue
-                if isinstance(value, (list, tuple)):
-                    query[str(key)] = value
-                else:
-                    query[str(key)] = str(value)
-            if offset:
-                query["offset"] = offset
-            payload = _get_json(session, url, query)
-            data = payload.get("data") if isinstance(payload, dict) else None
-            if data is None:
-                data = payload
-            if isinstance(data, dict):
-                data = [data]
-            if not data:
-                break
-            results.extend(data)
-            next_token = payload.get("next") if isinstance(payload, dict) else None
-            if not next_token:
-                break
-            offset = str(next_token)
-    finally:
-        session.close()
-    return results
+    while True:
+        query: Dict[str, object] = {}
+        for key, value in params.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                query[str(key)] = value
+            else:
+                query[str(key)] = str(value)
+        if offset:
+            query[cursor_param] = offset
+        payload = _get_json(session, url, query)
+        data = payload.get("data") if isinstance(payload, dict) else None
+        if data is None:
+            data = payload
+        if isinstance(data, dict):
+            data = [data]
+        if not data:
+            break
+        yield from data
+        next_token = payload.get("next") if isinstance(payload, dict) else None
+        if not next_token:
+            break
+        offset = str(next_token)
+
+
+def ch_get_paginated(url: str, params: Dict[str, object]) -> List[Dict]:
+    return list(ch_iter_paginated(url, params))
 
 
 # =========================
@@ -147,45 +199,50 @@ def ch_iter_people_v2(fields: str = PEOPLE_FIELDS, page_size: Optional[int] = No
     Devuelve dicts con claves "aplanadas" (ChartHop v2 retorna keys con punto).
     """
     url = f"{CH_API}/v2/org/{CH_ORG_ID}/person"
-    session = _new_session()
+    session = _SESSION
     limit = page_size or CH_PEOPLE_PAGE_SIZE or 200
     if limit <= 0:
         limit = 200
 
+    def fetch_page(cursor: Optional[str]) -> Dict:
+        params: Dict[str, object] = {
+            "fields": fields,
+            "limit": limit,
+            "includeAll": False,
+        }
+        if cursor:
+            # ChartHop v2 person listing (see /v2/org/{orgId}/person in the swagger)
+            # uses the `from` query parameter to continue pagination.
+            params["from"] = cursor
+        return _get_json(session, url, params)
+
     cursor: Optional[str] = None
     seen_cursors: set[str] = set()
+    pending: Optional[Future] = None
+    payload = fetch_page(None)
 
-    try:
-        while True:
-            params = {
-                "fields": fields,
-                "limit": limit,
-                "includeAll": False,
-            }
-            if cursor:
-                if cursor in seen_cursors:
-                    break
-                # ChartHop v2 person listing (see /v2/org/{orgId}/person in the swagger)
-                # uses the `from` query parameter to continue pagination.
-                params["from"] = cursor
-
-            payload = _get_json(session, url, params)
-            data = payload.get("data") or []
-            if isinstance(data, dict):
-                data = [data]
-            if not data:
-                break
-
-            for item in data:
-                yield item
-
-            next_token = payload.get("next")
-            if not next_token:
-                break
+    while True:
+        data = payload.get("data") or []
+        if isinstance(data, dict):
+            data = [data]
+        if not data:
+            break
+
+        # La página siguiente se pide antes de entregar la actual: la red trabaja
+        # mientras quien consume procesa estos registros.
+        next_token = payload.get("next")
+        if next_token:
             seen_cursors.add(cursor or "")
             cursor = str(next_token)
-    finally:
-        session.close()
+            if cursor not in seen_cursors:
+                pending = _PAGE_EXECUTOR.submit(fetch_page, cursor)
+
+        yield from data
+
+        if pending is None:
+            break
+        payload = pending.result()
+        pending = None
 
 
 # =========================
@@ -195,17 +252,30 @@ def ch_iter_people_v2(fields: str = PEOPLE_FIELDS, page_size: Optional[int] = No
 def ch_get_job_employment(job_id: str, session: Optional[Session] = None) -> Optional[str]:
     if not job_id:
         return None
-    own = False
     if session is None:
-        session = _new_session()
-        own = True
-    try:
-        url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
-        payload = _get_json(session, url, {"fields": "employment"})
-        return (payload or {}).get("employment") or None
-    finally:
-        if own:
-            session.close()
+        session = _SESSION
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
+    payload = _get_json(session, url, {"fields": "employment"})
+    return (payload or {}).get("employment") or None
+
+
+def ch_get_jobs_employment(page_size: Optional[int] = None) -> Dict[str, Optional[str]]:
+    """
+    Employment de todos los jobs ocupados en un listado paginado de /v2/org/{org}/job
+    proyectado a `id,employment` (una página cada N jobs en vez de un GET por job).
+    """
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job"
+    params: Dict[str, object] = {
+        "q": "open:filled",
+        "fields": "id,employment",
+        "limit": page_size or CH_PEOPLE_PAGE_SIZE or 200,
+    }
+    employment: Dict[str, Optional[str]] = {}
+    for job in ch_iter_paginated(url, params, cursor_param="from"):
+        job_id = (job.get("id") or "").strip()
+        if job_id:
+            employment[job_id] = job.get("employment") or None
+    return employment
 
 
 def ch_get_job_id_for_person(
@@ -218,31 +288,25 @@ def ch_get_job_id_for_person(
     if not person_id:
         return None
 
-    own = False
     if session is None:
-        session = _new_session()
-        own = True
+        session = _SESSION
 
-    try:
-        url = f"{CH_API}/v2/org/{CH_ORG_ID}/job"
-        params = {
-            "q": f'open:filled AND personId="{person_id}"',
-            "fields": "id",
-            "limit": "1",
-        }
-        payload = _get_json(session, url, params)
-        data = payload.get("data") if isinstance(payload, dict) else payload
-        if isinstance(data, list):
-            row = data[0] if data else None
-        else:
-            row = data
-        if not isinstance(row, dict):
-            return None
-        job_id = (row.get("id") or "").strip()
-        return job_id or None
-    finally:
-        if own:
-            session.close()
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job"
+    params = {
+        "q": f'open:filled AND personId="{person_id}"',
+        "fields": "id",
+        "limit": "1",
+    }
+    payload = _get_json(session, url, params)
+    data = payload.get("data") if isinstance(payload, dict) else payload
+    if isinstance(data, list):
+        row = data[0] if data else None
+    else:
+        row = data
+    if not isinstance(row, dict):
+        return None
+    job_id = (row.get("id") or "").strip()
+    return job_id or None
 
 
 def ch_get_job_ctc(
@@ -255,29 +319,19 @@ def ch_get_job_ctc(
     if not job_id:
         return None
 
-    own = False
     if session is None:
-        session = _new_session()
-        own = True
+        session = _SESSION
 
-    fields = ",".join(code for code in CTC_FIELD_CODES if code)
-    if not fields:
+    if not _CTC_FIELDS:
         return None
 
-    try:
-        url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
-        payload = _get_json(session, url, {"fields": fields}) or {}
-        for code in CTC_FIELD_CODES:
-            code = code.strip()
-            if not code:
-                continue
-            money = payload.get(code)
-            if isinstance(money, dict) and "amount" in money:
-                return money
-        return None
-    finally:
-        if own:
-            session.close()
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
+    payload = _get_json(session, url, {"fields": _CTC_FIELDS}) or {}
+    for code in CTC_FIELD_CODES:
+        money = payload.get(code)
+        if isinstance(money, dict) and "amount" in money:
+            return money
+    return None
 
 
 PEOPLE_COMPENSATION_FIELDS = ",".join([
@@ -310,111 +364,105 @@ def ch_get_job_compensation_fields(
     if not job_id:
         return None
 
-    own = False
     if session is None:
-        session = _new_session()
-        own = True
+        session = _SESSION
 
-    try:
-        url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
+    fields_param = (
+        "baseComp,baseComp.annualized,baseComp.annualized.asOrgCurrency,comp.currency,"
+        "employment,esquemaDeContratacin,fields.esquemaDeContratacin"
+    )
+    if ESQUEMA_FIELD_API not in {
+        "esquemaDeContratacin",
+        "fields.esquemaDeContratacin",
+    }:
         fields_param = (
-            "baseComp,baseComp.annualized,baseComp.annualized.asOrgCurrency,comp.currency,"
-            "employment,esquemaDeContratacin,fields.esquemaDeContratacin"
+            f"{fields_param},{ESQUEMA_FIELD_API}"
+            if ESQUEMA_FIELD_API.startswith("fields.")
+            else f"{fields_param},{ESQUEMA_FIELD_API},fields.{ESQUEMA_FIELD_API}"
         )
-        if ESQUEMA_FIELD_API not in {
-            "esquemaDeContratacin",
-            "fields.esquemaDeContratacin",
-        }:
-            fields_param = (
-                f"{fields_param},{ESQUEMA_FIELD_API}"
-                if ESQUEMA_FIELD_API.startswith("fields.")
-                else f"{fields_param},{ESQUEMA_FIELD_API},fields.{ESQUEMA_FIELD_API}"
-            )
 
-        payload = _get_json(
-            session,
-            url,
-            {"fields": fields_param},
-        ) or {}
-
-        # ChartHop responses sometimes flatten field names ("comp.base")
-        # and sometimes nest them under "comp". Handle both cases defensively.
-        comp_base_raw: Optional[Any] = None
-
-        base_comp_data = payload.get("baseComp")
-        if isinstance(base_comp_data, dict):
-            annualized_data = base_comp_data.get("annualized")
-            if isinstance(annualized_data, dict):
-                comp_base_raw = annualized_data.get("asOrgCurrency")
-                if comp_base_raw is None:
-                    comp_base_raw = annualized_data.get("amount")
-            elif isinstance(annualized_data, (int, float, str)):
-                comp_base_raw = annualized_data
-        elif isinstance(base_comp_data, (int, float, str)):
-            comp_base_raw = base_comp_data
-
-        if comp_base_raw is None:
-            comp_base_raw = payload.get("baseComp.annualized.asOrgCurrency")
-        if comp_base_raw is None:
-            comp_base_raw = payload.get("comp.base")
-
-        comp_currency = payload.get("comp.currency")
-
-        comp_obj = payload.get("comp")
-        if comp_base_raw is None and isinstance(comp_obj, dict):
-            comp_base_raw = comp_obj.get("base")
-        if comp_currency is None and isinstance(comp_obj, dict):
-            comp_currency = comp_obj.get("currency")
-
-        # Normalize base: extract amount from money object if needed
-        comp_base: Optional[float] = None
-        if isinstance(comp_base_raw, dict):
-            # Money object: {"currency":"USD","amount":108000.0,"places":0}
-            amount = comp_base_raw.get("amount")
-            if amount is not None:
-                try:
-                    comp_base = float(amount)
-                except (ValueError, TypeError):
-                    comp_base = None
-        elif comp_base_raw is not None:
+    payload = _get_json(
+        session,
+        url,
+        {"fields": fields_param},
+    ) or {}
+
+    # ChartHop responses sometimes flatten field names ("comp.base")
+    # and sometimes nest them under "comp". Handle both cases defensively.
+    comp_base_raw: Optional[Any] = None
+
+    base_comp_data = payload.get("baseComp")
+    if isinstance(base_comp_data, dict):
+        annualized_data = base_comp_data.get("annualized")
+        if isinstance(annualized_data, dict):
+            comp_base_raw = annualized_data.get("asOrgCurrency")
+            if comp_base_raw is None:
+                comp_base_raw = annualized_data.get("amount")
+        elif isinstance(annualized_data, (int, float, str)):
+            comp_base_raw = annualized_data
+    elif isinstance(base_comp_data, (int, float, str)):
+        comp_base_raw = base_comp_data
+
+    if comp_base_raw is None:
+        comp_base_raw = payload.get("baseComp.annualized.asOrgCurrency")
+    if comp_base_raw is None:
+        comp_base_raw = payload.get("comp.base")
+
+    comp_currency = payload.get("comp.currency")
+
+    comp_obj = payload.get("comp")
+    if comp_base_raw is None and isinstance(comp_obj, dict):
+        comp_base_raw = comp_obj.get("base")
+    if comp_currency is None and isinstance(comp_obj, dict):
+        comp_currency = comp_obj.get("currency")
+
+    # Normalize base: extract amount from money object if needed
+    comp_base: Optional[float] = None
+    if isinstance(comp_base_raw, dict):
+        # Money object: {"currency":"USD","amount":108000.0,"places":0}
+        amount = comp_base_raw.get("amount")
+        if amount is not None:
             try:
-                comp_base = float(comp_base_raw)
+                comp_base = float(amount)
             except (ValueError, TypeError):
                 comp_base = None
+    elif comp_base_raw is not None:
+        try:
+            comp_base = float(comp_base_raw)
+        except (ValueError, TypeError):
+            comp_base = None
+
+    employment = payload.get("employment")
+
+    job_fields = payload.get("fields") or {}
+    esquema_contratacion = (
+        payload.get("esquemaDeContratacin")
+        or job_fields.get("esquemaDeContratacin")
+        or payload.get("fields.esquemaDeContratacin")
+        or payload.get(ESQUEMA_FIELD_API)
+        or job_fields.get(ESQUEMA_FIELD_API)
+        or payload.get(f"fields.{ESQUEMA_FIELD_API}")
+    )
 
-        employment = payload.get("employment")
-
-        job_fields = payload.get("fields") or {}
-        esquema_contratacion = (
-            payload.get("esquemaDeContratacin")
-            or job_fields.get("esquemaDeContratacin")
-            or payload.get("fields.esquemaDeContratacin")
-            or payload.get(ESQUEMA_FIELD_API)
-            or job_fields.get(ESQUEMA_FIELD_API)
-            or payload.get(f"fields.{ESQUEMA_FIELD_API}")
-        )
-
-        # Normalize esquema: if it's a list, take the first element
-        if isinstance(esquema_contratacion, list) and esquema_contratacion:
-            esquema_contratacion = esquema_contratacion[0]
+    # Normalize esquema: if it's a list, take the first element
+    if isinstance(esquema_contratacion, list) and esquema_contratacion:
+        esquema_contratacion = esquema_contratacion[0]
 
-        # Ensure esquema is a string or None
-        if esquema_contratacion and not isinstance(esquema_contratacion, str):
-            esquema_contratacion = str(esquema_contratacion)
+    # Ensure esquema is a string or None
+    if esquema_contratacion and not isinstance(esquema_contratacion, str):
+        esquema_contratacion = str(esquema_contratacion)
 
-        if not esquema_contratacion:
-            logger.debug("Job %s without %s", job_id, ESQUEMA_FIELD_API)
-            esquema_contratacion = None
+    if not esquema_contratacion:
+        logger.debug("Job %s without %s", job_id, ESQUEMA_FIELD_API)
+        esquema_contratacion = None
 
-        return {
-            "base": comp_base,
-            "currency": comp_currency,
-            "employment": employment,
-            "esquema_contratacion": esquema_contratacion,
-        }
-    finally:
-        if own:
-            session.close()
+    return {
+        "base": comp_base,
+        "currency": comp_currency,
+        "employment": employment,
+        "esquema_contratacion": esquema_contratacion,
+    }
 
 
 def ch_get_person_compensation(person_id: str) -> Optional[Dict[str, Any]]:
@@ -441,7 +489,7 @@ def ch_get_person_compensation(person_id: str) -> Optional[Dict[str, Any]]:
     if not person_id:
         return None
 
-    session = _new_session()
+    session = _SESSION
     try:
         url = f"{CH_API}/v2/org/{CH_ORG_ID}/person/{person_id}"
         payload = _get_json(
@@ -563,8 +611,6 @@ def ch_get_person_compensation(person_id: str) -> Optional[Dict[str, Any]]:
         if exc.response is not None and exc.response.status_code == 404:
             return None
         raise
-    finally:
-        session.close()
 
 
 def ch_fetch_people_with_compensation(
@@ -672,87 +718,102 @@ def _norm_date_str(s: Optional[str]) -> str:
         return s[:10]
     return s
 
-def _row_hash(row: dict) -> str:
-    """
-    Hash estable para detectar cambios relevantes en Culture Amp.
-    Usa solo el contenido de la fila (orden de claves determinista).
-    """
-    canonical = json.dumps(row, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
-    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
-
-
 def iter_culture_amp_rows_with_ids() -> Iterator[tuple[Dict[str, str], str]]:
     """
     Devuelve (row_CA, ch_person_id).
-    Employment Type se resuelve consultando Job una vez por jobId (cache local).
+    Employment Type sale del listado paginado de jobs; los jobIds que no vengan
+    ahí se consultan uno a uno (cache local), en paralelo para cada lote.
     """
-    job_cache: Dict[str, Optional[str]] = {}
-    session = _new_session()
     try:
-        for p in ch_iter_people_v2(PEOPLE_FIELDS):
-            email = (p.get("contact.workEmail") or "").strip()
-            if not email:
-                continue
+        job_cache = ch_get_jobs_employment()
+    except Exception as exc:
+        logger.warning("ChartHop job listing failed, falling back to per-job lookups: %r", exc)
+        job_cache = {}
+    people = ch_iter_people_v2(PEOPLE_FIELDS)
+    batch_size = CH_PEOPLE_PAGE_SIZE or 200
+    while True:
+        batch = list(islice(people, batch_size))
+        if not batch:
+            break
+        _prefetch_job_employment(batch, job_cache)
+        for p in batch:
+            row = _culture_amp_row(p, job_cache)
+            if row is not None:
+                yield row, (p.get("id") or "").strip()
+
+
+def _prefetch_job_employment(people: List[Dict], job_cache: Dict[str, Optional[str]]) -> None:
+    """Resuelve en paralelo el employment de los jobIds del lote que no estén en cache."""
+    job_ids = {
+        (p.get("jobId") or "").strip()
+        for p in people
+        if (p.get("contact.workEmail") or "").strip()
+    }
+    job_ids.discard("")
+    pending = [job_id for job_id in job_ids if job_id not in job_cache]
+    if not pending:
+        return
+    results = _LOOKUP_EXECUTOR.map(
+        lambda job_id: ch_get_job_employment(job_id, session=_SESSION), pending
+    )
+    for job_id, employment in zip(pending, results):
+        job_cache[job_id] = employment
 
-            emp_id = (
-                (p.get("contact.employee") or "").strip()
-                or (p.get("id") or "").strip()
-                or email
-            )
-            ch_person_id = (p.get("id") or "").strip()
 
-            pref_first = (p.get("name.pref") or "").strip()
-            pref_last = (p.get("name.preflast") or "").strip()
-            first = (p.get("name.first") or "").strip()
-            last = (p.get("name.last") or "").strip()
+def _culture_amp_row(p: Dict, job_cache: Dict[str, Optional[str]]) -> Optional[Dict[str, str]]:
+    """Arma la fila de Culture Amp de una persona (None si no tiene work email)."""
+    email = (p.get("contact.workEmail") or "").strip()
+    if not email:
+        return None
 
-            name_first = pref_first or first
-            name_last = pref_last or last
-            if name_first or name_last:
-                name = f"{name_first} {name_last}".strip()
-            else:
-                name = ""
-
-            manager_email = (p.get("manager.contact.workEmail") or "").strip()
-            city = (p.get("address.city") or "").strip()
-            country = (p.get("address.country") or "").strip()
-            title = (p.get("title") or "").strip()
-            seniority = (p.get("seniority") or "").strip()
-            start_date = _norm_date_str(p.get("startDateOrg"))
-            end_date = _norm_date_str(p.get("endDateOrg"))
-            department = (p.get("department.name") or "").strip()
-            gender = (p.get("gender") or "").strip()
-
-            job_id = (p.get("jobId") or "").strip()
-            if job_id:
-                if job_id in job_cache:
-                    employment = job_cache[job_id] or ""
-                else:
-                    employment = ch_get_job_employment(job_id, session=session) or ""
-                    job_cache[job_id] = employment
-            else:
-                employment = ""
-
-            row = {
-                "Employee Id": emp_id,
-                "Email": email,
-                "Name": name,
-                "Preferred Name": pref_first,
-                "Manager Email": manager_email,
-                "Manager": manager_email,
-                "Location": city,
-                "Job Title": title,
-                "Seniority": seniority,
-                "Start Date": start_date,
-                "End Date": end_date,
-                "Department": department,
-                "Country": country,
-                "Employment Type": employment,
-                "Gender": gender,
-            }
-            yield row, ch_person_id
-    finally:
-        session.close()
+    emp_id = (
+        (p.get("contact.employee") or "").strip()
+        or (p.get("id") or "").strip()
+        or email
+    )
+    pref_first = (p.get("name.pref") or "").strip()
+    pref_last = (p.get("name.preflast") or "").strip()
+    first = (p.get("name.first") or "").strip()
+    last = (p.get("name.last") or "").strip()
+
+    name_first = pref_first or first
+    name_last = pref_last or last
+    if name_first or name_last:
+        name = f"{name_first} {name_last}".strip()
+    else:
+        name = ""
+
+    manager_email = (p.get("manager.contact.workEmail") or "").strip()
+    city = (p.get("address.city") or "").strip()
+    country = (p.get("address.country") or "").strip()
+    title = (p.get("title") or "").strip()
+    seniority = (p.get("seniority") or "").strip()
+    start_date = _norm_date_str(p.get("startDateOrg"))
+    end_date = _norm_date_str(p.get("endDateOrg"))
+    department = (p.get("department.name") or "").strip()
+    gender = (p.get("gender") or "").strip()
+
+    job_id = (p.get("jobId") or "").strip()
+    employment = (job_cache.get(job_id) or "") if job_id else ""
+
+    row = {
+        "Employee Id": emp_id,
+        "Email": email,
+        "Name": name,
+        "Preferred Name": pref_first,
+        "Manager Email": manager_email,
+        "Manager": manager_email,
+        "Location": city,
+        "Job Title": title,
+        "Seniority": seniority,
+        "Start Date": start_date,
+        "End Date": end_date,
+        "Department": department,
+        "Country": country,
+        "Employment Type": employment,
+        "Gender": gender,
+    }
+    return row
 
 
 def iter_culture_amp_rows() -> Iterator[Dict[str, str]]:
@@ -764,17 +825,27 @@ def build_culture_amp_rows() -> List[Dict[str, str]]:
     return list(iter_culture_amp_rows())
 
 
+_CA_ROW_VALUES = itemgetter(*CULTURE_AMP_COLUMNS)
+
+
+def _ca_row_values(row: Dict[str, str]) -> tuple:
+    try:
+        return _CA_ROW_VALUES(row)
+    except KeyError:
+        # Filas incompletas (p. ej. de un manifest viejo): columnas faltantes vacías
+        return tuple(row.get(column, "") for column in CULTURE_AMP_COLUMNS)
+
+
+def write_culture_amp_csv(rows: Iterable[Dict[str, str]], fh: IO[str]) -> None:
+    """Escribe encabezado + filas de Culture Amp en un archivo de texto ya abierto."""
+    writer = csv.writer(fh, lineterminator="\n")
+    writer.writerow(CULTURE_AMP_COLUMNS)
+    writer.writerows(map(_ca_row_values, rows))
+
+
 def culture_amp_csv_from_rows(rows: Iterable[Dict[str, str]]) -> str:
     sio = io.StringIO()
-    writer = csv.DictWriter(
-        sio,
-        fieldnames=CULTURE_AMP_COLUMNS,
-        extrasaction="ignore",
-        lineterminator="\n",
-    )
-    writer.writeheader()
-    for row in rows:
-        writer.writerow(row)
+    write_culture_amp_csv(rows, sio)
     return sio.getvalue()
 
 
@@ -833,11 +904,26 @@ def _stringify_fields(data: Dict[str, object]) -> Dict[str, str]:
 # =========================
 
 
-def ch_find_job(job_id: str) -> Optional[Dict]:
+# Jobs leídos recientemente: absorbe eventos duplicados y reintentos de webhook
+_JOB_CACHE = TimedCache(60)
+
+
+def ch_find_job(job_id: str, use_cache: bool = True) -> Optional[Dict]:
     job_id = (job_id or "").strip()
     if not job_id:
         return None
-    session = _new_session()
+    if use_cache:
+        cached = _JOB_CACHE.get(job_id)
+        if cached is not None:
+            return cached
+    job = _ch_fetch_job(job_id)
+    if job:
+        _JOB_CACHE.set(job_id, job)
+    return job
+
+
+def _ch_fetch_job(job_id: str) -> Optional[Dict]:
+    session = _SESSION
     try:
         url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
         resp = session.get(
@@ -849,7 +935,7 @@ def ch_find_job(job_id: str) -> Optional[Dict]:
             return None
         resp.raise_for_status()
         try:
-            payload = resp.json() or {}
+            payload = _json.loads(resp.content) or {}
         except ValueError:
             return {}
         entity = _extract_entity(payload)
@@ -858,8 +944,6 @@ def ch_find_job(job_id: str) -> Optional[Dict]:
         if exc.response is not None and exc.response.status_code == 404:
             return None
         raise
-    finally:
-        session.close()
 
 
 def ch_upsert_job_field(job_id: str, field_api_name: str, value: object) -> Dict:
@@ -869,20 +953,18 @@ def ch_upsert_job_field(job_id: str, field_api_name: str, value: object) -> Dict
         raise ValueError("job_id is required")
     if not field_api_name:
         raise ValueError("field_api_name is required")
-    session = _new_session()
+    _JOB_CACHE.delete(job_id)
+    session = _SESSION
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
+    payload = {"fields": {field_api_name: value}}
+    resp = session.patch(url, json=payload, timeout=HTTP_TIMEOUT)
+    resp.raise_for_status()
     try:
-        url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
-        payload = {"fields": {field_api_name: value}}
-        resp = session.patch(url, json=payload, timeout=HTTP_TIMEOUT)
-        resp.raise_for_status()
-        try:
-            body = resp.json() or {}
-        except ValueError:
-            body = {}
-        entity = _extract_entity(body)
-        return entity or body
-    finally:
-        session.close()
+        body = _json.loads(resp.content) or {}
+    except ValueError:
+        body = {}
+    entity = _extract_entity(body)
+    return entity or body
 
 
 def ch_update_job_ctc(job_id: str, new_ctc: float, currency: str = "USD") -> Dict:
@@ -892,29 +974,27 @@ def ch_update_job_ctc(job_id: str, new_ctc: float, currency: str = "USD") -> Dic
     job_id = (job_id or "").strip()
     if not job_id:
         raise ValueError("job_id is required")
+    _JOB_CACHE.delete(job_id)
 
-    session = _new_session()
-    try:
-        url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
+    session = _SESSION
+    url = f"{CH_API}/v2/org/{CH_ORG_ID}/job/{job_id}"
 
-        # El payload para campos nativos debe usar claves de nivel superior,
-        # según la especificación del endpoint PATCH /v2/job/{jobId}.
-        payload = {
-            "costToCompany": {
-                "amount": round(new_ctc, 2),
-                "currency": currency,
-            }
+    # El payload para campos nativos debe usar claves de nivel superior,
+    # según la especificación del endpoint PATCH /v2/job/{jobId}.
+    payload = {
+        "costToCompany": {
+            "amount": round(new_ctc, 2),
+            "currency": currency,
         }
+    }
 
-        resp = session.patch(url, json=payload, timeout=HTTP_TIMEOUT)
-        resp.raise_for_status()
-        try:
-            body = resp.json() or {}
-        except ValueError:
-            body = {}
-        return _extract_entity(body) or body
-    finally:
-        session.close()
+    resp = session.patch(url, json=payload, timeout=HTTP_TIMEOUT)
+    resp.raise_for_status()
+    try:
+        body = _json.loads(resp.content) or {}
+    except ValueError:
+        body = {}
+    return _extract_entity(body) or body
 
 
 # =========================
@@ -961,58 +1041,135 @@ def ch_import_people_csv(rows: Iterable[Dict[str, object]]) -> Dict:
     sio = io.StringIO()
     writer = csv.DictWriter(sio, fieldnames=fieldnames, extrasaction="ignore", lineterminator="\n")
     writer.writeheader()
-    for row in normalized_rows:
-        writer.writerow(row)
+    writer.writerows(normalized_rows)
     csv_payload = sio.getvalue()
+    sio.close()
 
-    session = _new_session()
+    session = _SESSION
+    create_resp = session.post(
+        f"{CH_API}/v1/org/{CH_ORG_ID}/import/csv",
+        json={"type": "person", "recordType": "person"},
+        timeout=HTTP_TIMEOUT,
+    )
+    create_resp.raise_for_status()
     try:
-        create_resp = session.post(
-            f"{CH_API}/v1/org/{CH_ORG_ID}/import/csv",
-            json={"type": "person", "recordType": "person"},
-            timeout=HTTP_TIMEOUT,
-        )
-        create_resp.raise_for_status()
-        try:
-            create_body = create_resp.json() or {}
-        except ValueError:
-            create_body = {}
-        import_id = (
-            create_body.get("importId")
-            or create_body.get("import_id")
-            or create_body.get("id")
-        )
-        if not import_id:
-            raise RuntimeError("ChartHop CSV import did not return an importId")
+        create_body = _json.loads(create_resp.content) or {}
+    except ValueError:
+        create_body = {}
+    import_id = (
+        create_body.get("importId")
+        or create_body.get("import_id")
+        or create_body.get("id")
+    )
+    if not import_id:
+        raise RuntimeError("ChartHop CSV import did not return an importId")
+
+    # El endpoint recibe el CSV embebido en JSON (no multipart): se serializa
+    # una sola vez directo a bytes en lugar de dejar que requests lo re-codifique.
+    data_body = _json.dumps({"importId": import_id, "data": csv_payload, "hasHeaders": True})
+    del csv_payload
+    data_resp = session.post(
+        f"{CH_API}/v1/org/{CH_ORG_ID}/import/csv/data",
+        data=data_body,
+        headers={"Content-Type": "application/json"},
+        timeout=HTTP_TIMEOUT,
+    )
+    data_resp.raise_for_status()
 
-        data_resp = session.post(
-            f"{CH_API}/v1/org/{CH_ORG_ID}/import/csv/data",
-            json={"importId": import_id, "data": csv_payload, "hasHeaders": True},
-            timeout=HTTP_TIMEOUT,
-        )
-        data_resp.raise_for_status()
+    submit_resp = session.post(
+        f"{CH_API}/v1/org/{CH_ORG_ID}/import/csv/submit",
+        json={"importId": import_id, "options": {"sendInviteEmails": False}},
+        timeout=HTTP_TIMEOUT,
+    )
+    submit_resp.raise_for_status()
+    try:
+        submit_body = _json.loads(submit_resp.content) or {}
+    except ValueError:
+        submit_body = {}
 
-        submit_resp = session.post(
-            f"{CH_API}/v1/org/{CH_ORG_ID}/import/csv/submit",
-            json={"importId": import_id, "options": {"sendInviteEmails": False}},
-            timeout=HTTP_TIMEOUT,
-        )
-        submit_resp.raise_for_status()
-        try:
-            submit_body = submit_resp.json() or {}
-        except ValueError:
-            submit_body = {}
+    # Los work emails recién importados ya no están libres
+    _remember_assigned_emails(row.get("contact workemail") or "" for row in normalized_rows)
+
+    result = {
+        "importId": import_id,
+        "rows": len(normalized_rows),
+        "submitted": True,
+    }
+    if submit_body:
+        result["response"] = submit_body
+    return result
 
-        result = {
-            "importId": import_id,
-            "rows": len(normalized_rows),
-            "submitted": True,
-        }
-        if submit_body:
-            result["response"] = submit_body
-        return result
-    finally:
-        session.close()
+
+# Emails existentes en ChartHop (work y personal, en minúsculas). Un solo
+# recorrido del listado de personas cada 5 min sirve a todos los nombres; las
+# ráfagas de contrataciones no vuelven a recorrer ChartHop por cada prefijo.
+_KNOWN_EMAILS_CACHE = TimedCache(ttl_seconds=300)
+
+# Emails importados por este proceso que el listado de ChartHop todavía no
+# muestra (caché vigente). Se depuran cada vez que se reconstruye el listado.
+_ASSIGNED_EMAILS: set[str] = set()
+# Emails elegidos para una contratación cuyo import sigue en curso. Se liberan
+# con release_work_email al terminar el import (si falló, quedan libres de nuevo).
+_RESERVED_EMAILS: set[str] = set()
+_ASSIGNED_EMAILS_LOCK = threading.Lock()
+
+
+def _remember_assigned_emails(emails: Iterable[str]) -> None:
+    normalized = {(email or "").strip().lower() for email in emails}
+    normalized.discard("")
+    if normalized:
+        with _ASSIGNED_EMAILS_LOCK:
+            _ASSIGNED_EMAILS.update(normalized)
+
+
+def _known_emails(use_cache: bool = True) -> frozenset[str]:
+    if use_cache:
+        cached = _KNOWN_EMAILS_CACHE.get("all")
+        if cached is not None:
+            return cached
+
+    emails: set[str] = set()
+    for person in ch_iter_people_v2("contact.workEmail,contact.personalEmail"):
+        for key in ("contact.workEmail", "contact.personalEmail"):
+            email = (person.get(key) or "").strip().lower()
+            if email:
+                emails.add(email)
+
+    known = frozenset(emails)
+    _KNOWN_EMAILS_CACHE.set("all", known)
+    with _ASSIGNED_EMAILS_LOCK:
+        _ASSIGNED_EMAILS.difference_update(known)
+    return known
+
+
+def release_work_email(email: str) -> None:
+    """Libera la reserva de un email de generate_unique_work_email."""
+    with _ASSIGNED_EMAILS_LOCK:
+        _RESERVED_EMAILS.discard((email or "").strip().lower())
+
+
+def ch_find_emails_with_prefix(local_prefix: str, domain: str, use_cache: bool = True) -> set[str]:
+    """
+    Devuelve (en minúsculas) los emails de ChartHop, work o personal, cuyo
+    local-part empieza con ``local_prefix`` dentro de ``domain``, más los que
+    este proceso ya asignó o reservó. Los candidatos se validan localmente contra este
+    set sin más llamadas HTTP.
+    """
+    prefix = (local_prefix or "").strip().lower()
+    suffix = "@" + (domain or "").strip().lower().lstrip("@")
+
+    matches = {
+        email
+        for email in _known_emails(use_cache)
+        if email.startswith(prefix) and email.endswith(suffix)
+    }
+    with _ASSIGNED_EMAILS_LOCK:
+        matches.update(
+            email
+            for email in _ASSIGNED_EMAILS.union(_RESERVED_EMAILS)
+            if email.startswith(prefix) and email.endswith(suffix)
+        )
+    return matches
 
 
 def generate_unique_work_email(first_name: str, last_name: str) -> str:
@@ -1028,23 +1185,26 @@ def generate_unique_work_email(first_name: str, last_name: str) -> str:
     base = ".".join(parts) if parts else "team"
     base = base.strip(".") or "team"
 
-    existing: set[str] = set()
-    for person in ch_iter_people_v2("contact.workEmail,contact.personalEmail"):
-        work = (person.get("contact.workEmail") or "").strip().lower()
-        personal = (person.get("contact.personalEmail") or "").strip().lower()
-        if work:
-            existing.add(work)
-        if personal:
-            existing.add(personal)
-
-    candidate = f"{base}@{domain}"
-    if candidate not in existing:
-        return candidate
-
-    for idx in range(2, 1000):
-        candidate = f"{base}{idx}@{domain}"
-        if candidate not in existing:
-            return candidate
+    # Sufijos numéricos ya usados ("" = sin sufijo); el primero libre se calcula
+    # localmente a partir de una sola consulta.
+    pattern = re.compile(rf"{re.escape(base)}(\d*)@{re.escape(domain)}")
+    existing = ch_find_emails_with_prefix(base, domain)
+
+    # La elección y la reserva van bajo el lock: dos contrataciones simultáneas
+    # con el mismo nombre no reciben el mismo email. La reserva dura hasta que
+    # el caller llama release_work_email; si el import tuvo éxito, el email ya
+    # quedó en _ASSIGNED_EMAILS (ver ch_import_people_csv).
+    with _ASSIGNED_EMAILS_LOCK:
+        used = {
+            match.group(1)
+            for email in existing.union(_ASSIGNED_EMAILS, _RESERVED_EMAILS)
+            if (match := pattern.fullmatch(email))
+        }
+        for suffix in ("", *map(str, range(2, 1000))):
+            if suffix not in used:
+                email = f"{base}{suffix}@{domain}"
+                _RESERVED_EMAILS.add(email)
+                return email
 
     raise RuntimeError("No hay emails disponibles con el dominio corporativo")
 
@@ -1081,62 +1241,59 @@ def ch_people_starting_between(
     end_date = _normalize_date_arg(end)
     results: List[Dict] = []
     job_cache: Dict[str, Optional[str]] = {}
-    job_session = _new_session()
-    try:
-        for person in ch_iter_people_v2(PEOPLE_ONBOARD_FIELDS):
-            start_raw = (person.get("startDateOrg") or "").strip()
-            start_dt = _parse_iso_date(start_raw)
-            if start_dt is None:
-                continue
-            if start_date and start_dt < start_date:
-                continue
-            if end_date and start_dt > end_date:
-                continue
+    job_session = _SESSION
+    for person in ch_iter_people_v2(PEOPLE_ONBOARD_FIELDS):
+        start_raw = (person.get("startDateOrg") or "").strip()
+        start_dt = _parse_iso_date(start_raw)
+        if start_dt is None:
+            continue
+        if start_date and start_dt < start_date:
+            continue
+        if end_date and start_dt > end_date:
+            continue
 
-            person_id = (person.get("id") or "").strip()
-            job_id = (person.get("jobId") or "").strip()
-            employment = (person.get("employmentType") or "").strip()
-            if not employment and job_id:
-                if job_id in job_cache:
-                    employment = job_cache[job_id] or ""
-                else:
-                    employment = ch_get_job_employment(job_id, session=job_session) or ""
-                    job_cache[job_id] = employment
-
-            pref_first = (person.get("name.pref") or "").strip()
-            pref_last = (person.get("name.preflast") or "").strip()
-            legal_first = (person.get("name.first") or "").strip()
-            legal_last = (person.get("name.last") or "").strip()
-            first_value = pref_first or legal_first
-            last_value = pref_last or legal_last
-            full_name = (person.get("name.full") or "").strip()
-            if not full_name:
-                full_name = f"{first_value} {last_value}".strip()
-
-            fields = {
-                "employee id": (person.get("contact.employee") or person_id),
-                "job id": job_id,
-                "name": full_name,
-                "name first": first_value,
-                "name last": last_value,
-                "employment type": employment,
-                "employmenttype": employment,
-                "start date": _norm_date_str(start_raw),
-                "startdate": _norm_date_str(start_raw),
-                "end date": _norm_date_str(person.get("endDateOrg")),
-                "contact workemail": (person.get("contact.workEmail") or ""),
-                "contact work email": (person.get("contact.workEmail") or ""),
-                "contact personalemail": (person.get("contact.personalEmail") or ""),
-                "manager contact workemail": (person.get("manager.contact.workEmail") or ""),
-            }
-            normalized_fields = _stringify_fields(fields)
-            results.append({
-                "id": person_id,
-                "jobId": job_id,
-                "fields": normalized_fields,
-            })
-    finally:
-        job_session.close()
+        person_id = (person.get("id") or "").strip()
+        job_id = (person.get("jobId") or "").strip()
+        employment = (person.get("employmentType") or "").strip()
+        if not employment and job_id:
+            if job_id in job_cache:
+                employment = job_cache[job_id] or ""
+            else:
+                employment = ch_get_job_employment(job_id, session=job_session) or ""
+                job_cache[job_id] = employment
+
+        pref_first = (person.get("name.pref") or "").strip()
+        pref_last = (person.get("name.preflast") or "").strip()
+        legal_first = (person.get("name.first") or "").strip()
+        legal_last = (person.get("name.last") or "").strip()
+        first_value = pref_first or legal_first
+        last_value = pref_last or legal_last
+        full_name = (person.get("name.full") or "").strip()
+        if not full_name:
+            full_name = f"{first_value} {last_value}".strip()
+
+        fields = {
+            "employee id": (person.get("contact.employee") or person_id),
+            "job id": job_id,
+            "name": full_name,
+            "name first": first_value,
+            "name last": last_value,
+            "employment type": employment,
+            "employmenttype": employment,
+            "start date": _norm_date_str(start_raw),
+            "startdate": _norm_date_str(start_raw),
+            "end date": _norm_date_str(person.get("endDateOrg")),
+            "contact workemail": (person.get("contact.workEmail") or ""),
+            "contact work email": (person.get("contact.workEmail") or ""),
+            "contact personalemail": (person.get("contact.personalEmail") or ""),
+            "manager contact workemail": (person.get("manager.contact.workEmail") or ""),
+        }
+        normalized_fields = _stringify_fields(fields)
+        results.append({
+            "id": person_id,
+            "jobId": job_id,
+            "fields": normalized_fields,
+        })
     return results
 
 
@@ -1144,7 +1301,7 @@ def ch_get_person(person_id: str) -> Optional[Dict]:
     person_id = (person_id or "").strip()
     if not person_id:
         return None
-    session = _new_session()
+    session = _SESSION
     try:
         url = f"{CH_API}/v2/org/{CH_ORG_ID}/person/{person_id}"
         payload = _get_json(session, url, {"include": "contacts,contact,fields"})
@@ -1159,8 +1316,6 @@ def ch_get_person(person_id: str) -> Optional[Dict]:
         if exc.response is not None and exc.response.status_code == 404:
             return None
         raise
-    finally:
-        session.close()
 
 def ch_person_primary_email(person: Dict) -> str:
     if not isinstance(person, dict):
@@ -1256,15 +1411,22 @@ def _normalize_timeoff_entry(
     return entry_copy
 
 
-def ch_fetch_timeoff_basic(start: str, end: str) -> List[Dict]:
-    """GET /v1/org/{orgId}/timeoff con paginación, sin include."""
+_TIMEOFF_PAGE_SIZE = 200
+
+
+def ch_iter_timeoff_basic(start: str, end: str) -> Iterator[Dict]:
+    """GET /v1/org/{orgId}/timeoff con paginación, sin include (una página a la vez)."""
     url = f"{os.environ['CH_API']}/v1/org/{os.environ['CH_ORG_ID']}/timeoff"
-    params: Dict[str, object] = {"limit": 200}
+    params: Dict[str, object] = {"limit": _TIMEOFF_PAGE_SIZE}
     if start:
         params["startDate[gte]"] = start
     if end:
         params["startDate[lte]"] = end
-    return ch_get_paginated(url, params)
+    return ch_iter_paginated(url, params)
+
+
+def ch_fetch_timeoff_basic(start: str, end: str) -> List[Dict]:
+    return list(ch_iter_timeoff_basic(start, end))
 
 
 def _person_email(person: Dict) -> Optional[str]:
@@ -1292,7 +1454,7 @@ def ch_fetch_people_by_ids(ids: List[str]) -> Dict[str, Dict]:
     """Devuelve map personId -> {email, name, title} haciendo batch de 100 ids."""
     if not ids:
         return {}
-    all_people: List[Dict] = []
+    pmap: Dict[str, Dict] = {}
     for i in range(0, len(ids), 100):
         batch = [str(pid) for pid in ids[i : i + 100] if pid]
         if not batch:
@@ -1300,16 +1462,14 @@ def ch_fetch_people_by_ids(ids: List[str]) -> Dict[str, Dict]:
         chunk = ",".join(batch)
         url = f"{os.environ['CH_API']}/v1/org/{os.environ['CH_ORG_ID']}/person"
         params = {"ids": chunk, "include": "contact,contacts"}
-        all_people += ch_get_paginated(url, params)
-    pmap: Dict[str, Dict] = {}
-    for person in all_people:
-        email = _person_email(person)
-        if email:
-            pmap[person.get("id")] = {
-                "email": email,
-                "name": person.get("name"),
-                "title": person.get("title"),
-            }
+        for person in ch_iter_paginated(url, params):
+            email = _person_email(person)
+            if email:
+                pmap[person.get("id")] = {
+                    "email": email,
+                    "name": person.get("name"),
+                    "title": person.get("title"),
+                }
     return pmap
 
 
@@ -1331,45 +1491,66 @@ def ch_fetch_timeoff(
 
     events: List[Dict] = []
     offset: Optional[str] = None
-    session = _new_session()
-    try:
-        while True:
-            params = dict(base_params)
-            if offset:
-                params["offset"] = offset
-            payload = _get_json(session, url, params)
-            data = payload.get("data") or []
-            if isinstance(data, dict):
-                data = [data]
-            if not data:
-                break
-
-            for entry in data:
-                normalized = _normalize_timeoff_entry(
-                    entry,
-                    start_date=start_date,
-                    end_date=end_date,
-                )
-                if normalized:
-                    events.append(normalized)
-
-            next_token = payload.get("next")
-            if not next_token:
-                break
-            offset = str(next_token)
-        return events
-    finally:
-        session.close()
+    session = _SESSION
+    while True:
+        params = dict(base_params)
+        if offset:
+            params["offset"] = offset
+        payload = _get_json(session, url, params)
+        data = payload.get("data") or []
+        if isinstance(data, dict):
+            data = [data]
+        if not data:
+            break
+
+        for entry in data:
+            normalized = _normalize_timeoff_entry(
+                entry,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            if normalized:
+                events.append(normalized)
 
+        next_token = payload.get("next")
+        if not next_token:
+            break
+        offset = str(next_token)
+    return events
 
-def ch_fetch_timeoff_enriched(start: str, end: str) -> List[Dict]:
-    """Trae timeoff y enriquece cada item con personEmail/personName/personTitle."""
-    items = ch_fetch_timeoff_basic(start, end)
-    ids = sorted({it.get("personId") for it in items if it.get("personId")})
-    pmap = ch_fetch_people_by_ids(ids)
+
+def ch_iter_timeoff_enriched(start: str, end: str) -> Iterator[Dict]:
+    """
+    Trae timeoff y enriquece cada item con personEmail/personName/personTitle.
+    Procesa el listado página por página: las personas nuevas de cada página se
+    resuelven en batch y los registros se entregan sin esperar al resto.
+    """
+    items_iter = ch_iter_timeoff_basic(start, end)
+    pmap: Dict[str, Dict] = {}
+    resolved: set[str] = set()
     start_dt = _parse_iso_date(start)
     end_dt = _parse_iso_date(end)
-    enriched: List[Dict] = []
+    while True:
+        items = list(islice(items_iter, _TIMEOFF_PAGE_SIZE))
+        if not items:
+            break
+        ids = sorted({it.get("personId") for it in items if it.get("personId")} - resolved)
+        if ids:
+            pmap.update(ch_fetch_people_by_ids(ids))
+            resolved.update(ids)
+        yield from _enrich_timeoff_items(items, pmap, start_dt, end_dt)
+
+
+def ch_fetch_timeoff_enriched(start: str, end: str) -> List[Dict]:
+    return list(ch_iter_timeoff_enriched(start, end))
+
+
+def _enrich_timeoff_items(
+    items: List[Dict],
+    pmap: Dict[str, Dict],
+    start_dt: Optional[dt.date],
+    end_dt: Optional[dt.date],
+) -> Iterator[Dict]:
     for raw in items:
         entry = dict(raw)
         person = pmap.get(entry.get("personId"))
@@ -1385,21 +1566,17 @@ def ch_fetch_timeoff_enriched(start: str, end: str) -> List[Dict]:
                     normalized.setdefault("personName", person["name"])
                 if person.get("title"):
                     normalized.setdefault("personTitle", person["title"])
-            enriched.append(normalized)
-    return enriched
+            yield normalized
 
 
 def ch_get_timeoff(timeoff_id: str) -> Optional[Dict]:
     timeoff_id = (timeoff_id or "").strip()
     if not timeoff_id:
         return None
-    session = _new_session()
-    try:
-        url = f"{CH_API}/v1/org/{CH_ORG_ID}/timeoff/{timeoff_id}"
-        payload = _get_json(session, url, params={"include": "person"})
-        entry = payload.get("data") or payload
-        if not isinstance(entry, dict):
-            return None
-        return _normalize_timeoff_entry(entry)
-    finally:
-        session.close()
+    session = _SESSION
+    url = f"{CH_API}/v1/org/{CH_ORG_ID}/timeoff/{timeoff_id}"
+    payload = _get_json(session, url, params={"include": "person"})
+    entry = payload.get("data") or payload
+    if not isinstance(entry, dict):
+        return None
+    return _normalize_timeoff_entry(entry)
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import datetime as dt
 import os
 import logging
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from app.utils import _json
 from app.utils.rate_limiter import RateLimiter, TimedCache
 
 logger = logging.getLogger(__name__)
@@ -45,22 +50,37 @@ def _runn_headers() -> Dict[str, str]:
     }
 
 
-def runn_get_people() -> List[Dict[str, Any]]:
-    """Obtiene todas las personas de Runn utilizando paginación."""
+# Sesión compartida con pool de conexiones hacia Runn. Los reintentos
+# automáticos solo aplican a métodos idempotentes (GET/PUT/DELETE).
+_SESSION = requests.Session()
+_SESSION.headers.update(_runn_headers())
+_ADAPTER = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False),
+)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+# Cada respuesta informa al rate limiter de la cuota restante del lado de Runn
+_SESSION.hooks["response"].append(
+    lambda resp, *args, **kwargs: _RATE_LIMITER.observe_headers(resp.headers)
+)
+
+
+def runn_iter_people() -> Iterator[Dict[str, Any]]:
+    """Itera las personas de Runn página por página (una página en memoria a la vez)."""
     url = f"{RUNN_BASE_URL}/people/"
-    headers = _runn_headers()
-    people: List[Dict[str, Any]] = []
     cursor: Optional[str] = None
 
     while True:
         _RATE_LIMITER.wait_if_needed()
         params = {"cursor": cursor} if cursor else None
 
-        resp = requests.get(url, headers=headers, params=params, timeout=60)
+        resp = _SESSION.get(url, params=params, timeout=60)
         resp.raise_for_status()
-        data = resp.json()
+        data = _json.loads(resp.content)
 
-        people.extend(_extract_people_list(data))
+        yield from _extract_people_list(data)
 
         if isinstance(data, dict):
             cursor = data.get("nextCursor") or data.get("next_cursor")
@@ -70,7 +90,10 @@ def runn_get_people() -> List[Dict[str, Any]]:
         if not cursor:
             break
 
-    return people
+
+def runn_get_people() -> List[Dict[str, Any]]:
+    """Obtiene todas las personas de Runn utilizando paginación."""
+    return list(runn_iter_people())
 
 
 def runn_find_person_by_email(email: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
@@ -104,9 +127,9 @@ def runn_find_person_by_email(email: str, use_cache: bool = True) -> Optional[Di
     if not use_cache:
         return None
 
-    # Fallback: recargar todo el listado (puede ser costoso pero asegura consistencia)
+    # Fallback: recorrer el listado (se detiene en la página donde aparece)
     try:
-        for p in runn_get_people():
+        for p in runn_iter_people():
             em = (p.get("email") or "").strip().lower()
             if em and em == email_low:
                 _PEOPLE_CACHE.set(email_low, p)
@@ -126,14 +149,14 @@ def _fetch_person_by_email(email: str) -> Optional[Dict[str, Any]]:
 
     try:
         _RATE_LIMITER.wait_if_needed()
-        resp = requests.get(url, headers=_runn_headers(), params=params, timeout=60)
+        resp = _SESSION.get(url, params=params, timeout=60)
         if not resp.ok:
             logger.error(
                 "Failed to fetch person by email from Runn", extra={"email": email, "status": resp.status_code}
             )
             return None
 
-        for person in _extract_people_list(resp.json()):
+        for person in _extract_people_list(_json.loads(resp.content)):
             em = (person.get("email") or "").strip().lower()
             if em == email.strip().lower():
                 return person
@@ -157,9 +180,9 @@ def runn_get_roles() -> List[Dict[str, Any]]:
     
     url = f"{RUNN_BASE_URL}/roles"
     try:
-        resp = requests.get(url, headers=_runn_headers(), timeout=60)
+        resp = _SESSION.get(url, timeout=60)
         resp.raise_for_status()
-        data = resp.json()
+        data = _json.loads(resp.content)
         _ROLES_CACHE = data if isinstance(data, list) else []
         return _ROLES_CACHE
     except Exception as e:
@@ -224,10 +247,15 @@ def runn_upsert_person(
         payload["startsAt"] = starts_at
     
     try:
-        resp = requests.post(url, headers=_runn_headers(), json=payload, timeout=60)
+        resp = _SESSION.post(url, data=_json.dumps(payload), timeout=60)
         if resp.status_code in (200, 201):
             logger.info(f"Person created in Runn: {email}")
-            return resp.json()
+            created = _json.loads(resp.content)
+            # La respuesta ya trae la persona: los syncs siguientes (time-off,
+            # compensación) la encuentran en caché sin volver a buscarla.
+            if isinstance(created, dict) and created.get("id"):
+                _PEOPLE_CACHE.set(email.strip().lower(), created)
+            return created
         
         logger.error(f"runn_upsert_person failed {resp.status_code}: {resp.text}")
         return None
@@ -236,6 +264,7 @@ def runn_upsert_person(
         return None
 
 
+@lru_cache(maxsize=64)
 def runn_map_category_to_endpoint(category: str) -> str:
     """
     Mapea una categoría a un endpoint de time-off en v1.0.
@@ -272,11 +301,11 @@ def runn_get_existing_leave(
     params = {"personId": person_id}
     
     try:
-        resp = requests.get(url, headers=_runn_headers(), params=params, timeout=60)
+        resp = _SESSION.get(url, params=params, timeout=60)
         if not resp.ok:
             return None
         
-        time_offs = resp.json()
+        time_offs = _json.loads(resp.content)
         if not isinstance(time_offs, list):
             return None
         
@@ -340,9 +369,9 @@ def runn_create_timeoff(
         payload["note"] = note
 
     try:
-        resp = requests.post(url, headers=_runn_headers(), json=payload, timeout=60)
+        resp = _SESSION.post(url, data=_json.dumps(payload), timeout=60)
         if resp.status_code in (200, 201):
-            result = resp.json()
+            result = _json.loads(resp.content)
             logger.info(
                 f"Time-off created for person {person_id}: {start_date} to {end_date} "
                 f"(type: {endpoint_type}, id: {result.get('id')})"
@@ -375,11 +404,11 @@ def runn_list_person_timeoffs(person_id: int, timeoff_type: str = "leave") -> Li
     url = f"{RUNN_BASE_URL}/people/{person_id}/time-offs/{timeoff_type}"
 
     try:
-        resp = requests.get(url, headers=_runn_headers(), timeout=60)
+        resp = _SESSION.get(url, timeout=60)
         if not resp.ok:
             return []
 
-        data = resp.json()
+        data = _json.loads(resp.content)
         return data if isinstance(data, list) else []
     except Exception as e:
         logger.exception(f"Failed to list person time-offs: {e}")
@@ -428,9 +457,9 @@ def runn_update_timeoff(
         return None
 
     try:
-        resp = requests.put(url, headers=_runn_headers(), json=payload, timeout=60)
+        resp = _SESSION.put(url, data=_json.dumps(payload), timeout=60)
         if resp.status_code in (200, 201):
-            result = resp.json()
+            result = _json.loads(resp.content)
             logger.info(f"Time-off updated: {timeoff_id} (type: {endpoint_type})")
             return result
 
@@ -464,7 +493,7 @@ def runn_delete_timeoff(timeoff_id: int, category: str) -> bool:
     url = f"{RUNN_BASE_URL}/time-offs/{endpoint_type}/{timeoff_id}"
 
     try:
-        resp = requests.delete(url, headers=_runn_headers(), timeout=60)
+        resp = _SESSION.delete(url, timeout=60)
         if resp.status_code in (200, 204):
             logger.info(f"Time-off deleted: {timeoff_id} (type: {endpoint_type})")
             return True
@@ -507,14 +536,14 @@ def runn_get_person_contracts(person_id: int) -> List[Dict[str, Any]]:
     url = f"{RUNN_BASE_URL}/people/{person_id}/contracts"
 
     try:
-        resp = requests.get(url, headers=_runn_headers(), timeout=60)
+        resp = _SESSION.get(url, timeout=60)
         if not resp.ok:
             logger.error(
                 f"Failed to fetch contracts for person {person_id}: {resp.status_code}"
             )
             return []
 
-        data = resp.json()
+        data = _json.loads(resp.content)
 
         # Normalizar respuesta: puede ser lista directa o {"values": [...]}
         if isinstance(data, list):
@@ -549,8 +578,6 @@ def runn_get_active_contracts(
     Returns:
         Lista de contratos activos
     """
-    import datetime as dt
-
     contracts = runn_get_person_contracts(person_id)
 
     if not contracts:
@@ -607,9 +634,9 @@ def runn_update_contract_cost(
     }
 
     try:
-        resp = requests.patch(url, headers=_runn_headers(), json=payload, timeout=60)
+        resp = _SESSION.patch(url, data=_json.dumps(payload), timeout=60)
         if resp.status_code in (200, 201):
-            result = resp.json()
+            result = _json.loads(resp.content)
             logger.info(
                 f"Contract {contract_id} cost updated to {cost_rounded}/hour"
             )
@@ -3,14 +3,27 @@ from __future__ import annotations
 import io
 import os
 import socket
-from typing import Optional
+from typing import IO, Optional, Union
 
 import paramiko
 
+# Timeout de lectura del canal SFTP una vez abierto (segundos)
+_CHANNEL_TIMEOUT = 30
+
+# Ventana SSH amplia: con la ventana por defecto (2 MB) el envío se frena
+# esperando ajustes del servidor. Los límites de rekey quedan en los de paramiko.
+_WINDOW_SIZE = 2 ** 31 - 1
+
 
 def _sftp_ensure_dirs(sftp: paramiko.SFTPClient, remote_dir: str):
     if not remote_dir or remote_dir == "/":
         return
+    # Caso común: el directorio ya existe y basta un solo stat
+    try:
+        sftp.stat("/" + remote_dir.strip("/"))
+        return
+    except FileNotFoundError:
+        pass
     parts = []
     for segment in remote_dir.strip("/").split("/"):
         parts.append(segment)
@@ -26,19 +39,21 @@ def sftp_upload(
     host: str,
     username: str,
     remote_path: str,
-    content: str,
+    content: Union[str, bytes, IO[bytes]],
     pkey_pem: Optional[str] = None,
     password: Optional[str] = None,
     passphrase: Optional[str] = None,
 ):
     """
     Para Culture Amp: usa pkey_pem (OpenSSH) sin password.
+    content puede ser str (se codifica a UTF-8), bytes ya codificados o un
+    archivo binario con seek (se sube desde su posición actual sin copiarlo).
     """
     if not host or not username:
         raise RuntimeError("SFTP requiere host y username configurados")
 
     sock = socket.create_connection((host.rstrip("."), 22), timeout=15)
-    transport = paramiko.Transport(sock)
+    transport = paramiko.Transport(sock, default_window_size=_WINDOW_SIZE)
     transport.banner_timeout = 15
 
     key = None
@@ -57,13 +72,22 @@ def sftp_upload(
             transport.connect(username=username, password=password)
 
         sftp = paramiko.SFTPClient.from_transport(transport)
+        sftp.get_channel().settimeout(_CHANNEL_TIMEOUT)
         try:
             directory = os.path.dirname(remote_path) or "/"
             _sftp_ensure_dirs(sftp, directory)
-            with sftp.file(remote_path, "wb") as fh:
+            if hasattr(content, "read"):
+                fl = content
+                start = fl.tell()
+                file_size = fl.seek(0, io.SEEK_END) - start
+                fl.seek(start)
+            else:
                 data = content.encode("utf-8") if isinstance(content, str) else content
-                fh.write(data)
-                fh.flush()
+                # BytesIO comparte el buffer de `data` mientras no se modifique
+                fl, file_size = io.BytesIO(data), len(data)
+            # putfo escribe en modo pipelined (varios writes en vuelo) y al final
+            # confirma con stat que el tamaño remoto coincide.
+            sftp.putfo(fl, remote_path, file_size=file_size)
         finally:
             try:
                 sftp.close()
@@ -1,7 +1,10 @@
 from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from app.utils import _json
 from app.utils.config import (
     TT_API,
     TT_CF_JOB_CH_API_NAME,
@@ -10,9 +13,21 @@ from app.utils.config import (
     tt_headers,
 )
 
+# Sesión compartida con pool de conexiones hacia Teamtailor. Los reintentos
+# automáticos solo aplican a métodos idempotentes (GET/PUT/DELETE).
+_SESSION = requests.Session()
+_SESSION.headers.update(tt_headers())
+_ADAPTER = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False),
+)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
 def tt_create_job_from_ch(title: str, body: str = "Created from ChartHop", status: str = "unlisted"):
     payload = {"data": {"type": "jobs", "attributes": {"title": title or "Untitled", "body": body, "status": status}}}
-    r = requests.post(f"{TT_API}/jobs", headers=tt_headers(), json=payload, timeout=HTTP_TIMEOUT)
+    r = _SESSION.post(f"{TT_API}/jobs", json=payload, timeout=HTTP_TIMEOUT)
     return r
 
 
@@ -27,26 +42,37 @@ def tt_update_job(job_id: str, *, title: Optional[str] = None, body: Optional[st
     if not attributes:
         return None
     payload = {"data": {"type": "jobs", "id": str(job_id), "attributes": attributes}}
-    return requests.patch(f"{TT_API}/jobs/{job_id}", headers=tt_headers(), json=payload, timeout=HTTP_TIMEOUT)
+    return _SESSION.patch(f"{TT_API}/jobs/{job_id}", json=payload, timeout=HTTP_TIMEOUT)
+
+# api-name -> id de custom field; no cambia durante la vida del proceso. Solo se
+# cachean resoluciones exitosas para que un fallo transitorio se reintente.
+_CF_ID_CACHE: dict[str, str] = {}
+
 
 def tt_get_custom_field_id_by_api_name(api_name: str) -> str | None:
-    r = requests.get(f"{TT_API}/custom-fields", headers=tt_headers(),
+    cached = _CF_ID_CACHE.get(api_name)
+    if cached is not None:
+        return cached
+    r = _SESSION.get(f"{TT_API}/custom-fields",
                      params={"filter[api-name]": api_name}, timeout=HTTP_TIMEOUT)
     if not r.ok:
         return None
-    for cf in (r.json() or {}).get("data", []):
+    for cf in (_json.loads(r.content) or {}).get("data", []):
         attrs = cf.get("attributes") or {}
         if (attrs.get("api-name") or attrs.get("api_name")) == api_name:
-            return cf.get("id")
+            cf_id = cf.get("id")
+            if cf_id:
+                _CF_ID_CACHE[api_name] = cf_id
+            return cf_id
     return None
 
 def tt_find_job_custom_field_value_id(job_id: str, custom_field_id: str) -> str | None:
-    r = requests.get(f"{TT_API}/jobs/{job_id}", headers=tt_headers(),
+    r = _SESSION.get(f"{TT_API}/jobs/{job_id}",
                      params={"include": "custom-field-values,custom-field-values.custom-field"},
                      timeout=HTTP_TIMEOUT)
     if not r.ok:
         return None
-    inc = (r.json() or {}).get("included") or []
+    inc = (_json.loads(r.content) or {}).get("included") or []
     for item in inc:
         if item.get("type") == "custom-field-values":
             rel = (item.get("relationships") or {}).get("custom-field") or {}
@@ -54,6 +80,14 @@ def tt_find_job_custom_field_value_id(job_id: str, custom_field_id: str) -> str
                 return item.get("id")
     return None
 
+# (job_id, custom_field_id) -> id del custom-field-value, para actualizar con un solo PATCH
+_CFV_ID_CACHE: dict[tuple[str, str], str] = {}
+
+
+def _tt_patch_custom_field_value(cfv_id: str, value: str):
+    patch = {"data":{"id":cfv_id,"type":"custom-field-values","attributes":{"value":str(value)}}}
+    return _SESSION.patch(f"{TT_API}/custom-field-values/{cfv_id}", json=patch, timeout=HTTP_TIMEOUT)
+
 def tt_upsert_job_custom_field(job_id: str, value: str,
                                custom_field_id: str | None = None,
                                api_name: str | None = TT_CF_JOB_CH_API_NAME):
@@ -61,28 +95,40 @@ def tt_upsert_job_custom_field(job_id: str, value: str,
     if not cf_id:
         raise RuntimeError("No se pudo resolver el ID del custom field de Teamtailor")
 
+    # valor ya conocido: PATCH directo (si falla, p. ej. fue borrado, se sigue el flujo normal)
+    cache_key = (str(job_id), str(cf_id))
+    cfv_id = _CFV_ID_CACHE.get(cache_key)
+    if cfv_id:
+        pr = _tt_patch_custom_field_value(cfv_id, value)
+        if pr.ok:
+            return _json.loads(pr.content)
+        _CFV_ID_CACHE.pop(cache_key, None)
+
     # crear
     payload = {"data":{"type":"custom-field-values","attributes":{"value":str(value)},
               "relationships":{"owner":{"data":{"type":"jobs","id":str(job_id)}},
                                "custom-field":{"data":{"type":"custom-fields","id":str(cf_id)}}}}}
     url = f"{TT_API}/custom-field-values"
-    r = requests.post(url, headers=tt_headers(), json=payload, timeout=HTTP_TIMEOUT)
+    r = _SESSION.post(url, json=payload, timeout=HTTP_TIMEOUT)
     if r.status_code in (200, 201):
-        return r.json()
+        body = _json.loads(r.content)
+        created_id = ((body or {}).get("data") or {}).get("id")
+        if created_id:
+            _CFV_ID_CACHE[cache_key] = str(created_id)
+        return body
 
     # actualizar si ya existe
     cfv_id = tt_find_job_custom_field_value_id(job_id, cf_id)
     if cfv_id:
-        patch = {"data":{"id":cfv_id,"type":"custom-field-values","attributes":{"value":str(value)}}}
-        pr = requests.patch(f"{TT_API}/custom-field-values/{cfv_id}", headers=tt_headers(), json=patch, timeout=HTTP_TIMEOUT)
+        pr = _tt_patch_custom_field_value(cfv_id, value)
         pr.raise_for_status()
-        return pr.json()
+        _CFV_ID_CACHE[cache_key] = str(cfv_id)
+        return _json.loads(pr.content)
     r.raise_for_status()
 
 def tt_fetch_application(app_id: str):
-    return requests.get(
+    return _SESSION.get(
         f"{TT_API}/job-applications/{app_id}",
-        headers=tt_headers(),
         params={"include": "candidate,job,offers"},
         timeout=HTTP_TIMEOUT,
     )
@@ -93,7 +139,7 @@ def tt_get_offer_start_date_for_application(app_id: str, payload: Optional[dict]
             resp = tt_fetch_application(app_id)
             if not resp.ok:
                 return None
-            payload = resp.json() or {}
+            payload = _json.loads(resp.content) or {}
         for inc in (payload.get("included") or []):
             if inc.get("type") in ("job-offers", "offers"):
                 attrs = inc.get("attributes") or {}
@@ -105,9 +151,9 @@ def tt_get_offer_start_date_for_application(app_id: str, payload: Optional[dict]
         rels = (data.get("relationships") or {})
         links = (rels.get("offers") or rels.get("job-offers") or {}).get("links") or {}
         if links.get("related"):
-            rr = requests.get(links["related"], headers=tt_headers(), timeout=HTTP_TIMEOUT)
+            rr = _SESSION.get(links["related"], timeout=HTTP_TIMEOUT)
             if rr.ok:
-                body = rr.json() or {}
+                body = _json.loads(rr.content) or {}
                 items = body.get("data")
                 items = items if isinstance(items, list) else [items]
                 for of in items or []:
@@ -116,14 +162,13 @@ def tt_get_offer_start_date_for_application(app_id: str, payload: Optional[dict]
                     sd = (details.get("start-date") or details.get("start_date") or "").strip()
                     if sd:
                         return sd[:10]
-        rr = requests.get(
+        rr = _SESSION.get(
             f"{TT_API}/job-offers",
-            headers=tt_headers(),
             params={"filter[job-application-id]": app_id},
             timeout=HTTP_TIMEOUT,
         )
         if rr.ok:
-            for of in (rr.json() or {}).get("data", []):
+            for of in (_json.loads(rr.content) or {}).get("data", []):
                 attrs = of.get("attributes") or {}
                 details = attrs.get("details") or {}
                 sd = (details.get("start-date") or details.get("start_date") or "").strip()
@@ -1,37 +1,69 @@
+import logging
+import os
+
 from flask import Flask, request
+from flask.json.provider import DefaultJSONProvider
 
 from app.blueprints.charthop_webhook import bp_ch, ch_webhook as ch_handler
 from app.blueprints.teamtailor_webhook import bp_tt, tt_webhook as tt_handler
 from app.blueprints.cron import bp_cron
 from app.tasks.ca_export import bp_tasks  # <-- nuevo
 from app.tasks.charthop_worker import bp_charthop_tasks
+from app.utils.sync_metrics import flush_sync_metrics
+from app.utils import _json
+from app.utils.timeoff_mapping import flush_timeoff_mapping
+
+# Nivel de log configurable; los mensajes usan formato perezoso (%s) y solo se
+# formatean si el nivel los deja pasar.
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Parsea los bodies de request con orjson (vía app.utils._json) si está disponible."""
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return _json.loads(s)
+
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.register_blueprint(bp_ch)
 app.register_blueprint(bp_tt)
 app.register_blueprint(bp_cron)
 app.register_blueprint(bp_tasks)  # <-- nuevo
 app.register_blueprint(bp_charthop_tasks)
 
+
+@app.teardown_request
+def flush_sync_state(exc=None):
+    # Las métricas y el mapeo de timeoffs agrupan sus escrituras a GCS;
+    # se persisten al terminar cada request.
+    flush_sync_metrics()
+    flush_timeoff_mapping()
+
+
 @app.route("/health", methods=["GET"])
 def health():
     return "OK", 200
 
 @app.route("/", methods=["GET", "POST"])
 def root():
-    print(f"{request.method} {request.path} len={request.content_length}")
+    logger.debug("%s %s len=%s", request.method, request.path, request.content_length)
     if request.method == "GET":
         return "OK", 200
     if request.headers.get("Teamtailor-Signature"):
         return tt_handler()
+    # get_json cachea el resultado: el handler elegido no vuelve a parsear el body
     payload = request.get_json(force=True, silent=True) or {}
-    if "resource_id" in payload:
+    if isinstance(payload, dict) and "resource_id" in payload:
         return tt_handler()
     return ch_handler()
 
 # al final del archivo
 if __name__ == "__main__":
-    import os
     port = int(os.environ.get("PORT", 8080))
     # importante: 0.0.0.0 para que Cloud Run pase el healthcheck
     app.run(host="0.0.0.0", port=port)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import io
 import logging
 import os
-from typing import Dict
+from typing import Dict, Iterable, Optional
 
 from app.clients.sftp import sftp_upload
 from app.utils.config import (
@@ -12,60 +13,102 @@ from app.utils.config import (
     CH_API,
     CH_ORG_ID,
 )
-from app.utils.state_gcs import load_state, save_state
+from app.utils.state_gcs import ROW_HASH_ALGO, load_state, row_hash, save_state
 from app.clients.charthop import (
     CULTURE_AMP_COLUMNS,
-    build_culture_amp_rows,
-    culture_amp_csv_from_rows,
+    iter_culture_amp_rows,
     iter_culture_amp_rows_with_ids,
-    _row_hash,
-    _new_session,
+    write_culture_amp_csv,
+    _LOOKUP_EXECUTOR,
+    _SESSION,
     _get_json,
 )
 
 logger = logging.getLogger(__name__)
 
 
-def _upload_csv(text: str, *, dry_run: bool = False) -> None:
-    if not text.endswith("\n"):
-        text += "\n"
+def _upload_csv(rows: Iterable[Dict[str, str]], *, dry_run: bool = False) -> None:
     if not CA_SFTP_HOST or not CA_SFTP_USER or not CA_SFTP_KEY:
         raise RuntimeError("Credenciales SFTP incompletas: host, user y key son obligatorios")
     if dry_run:
         logger.info("dry_run=True: skip SFTP upload to Culture Amp")
         return
-    sftp_upload(
-        host=CA_SFTP_HOST,
-        username=CA_SFTP_USER,
-        pkey_pem=CA_SFTP_KEY,
-        remote_path="/employees.csv",
-        content=text,
-    )
+    # El CSV se escribe directo como UTF-8 en un buffer binario que paramiko lee
+    # tal cual (sin pasar por un str completo ni por una copia codificada). Se
+    # arma entero antes de conectar: un archivo a medias en Culture Amp
+    # desactivaría a las personas faltantes.
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    write_culture_amp_csv(rows, text)
+    text.flush()
+    buf.seek(0)
+    try:
+        sftp_upload(
+            host=CA_SFTP_HOST,
+            username=CA_SFTP_USER,
+            pkey_pem=CA_SFTP_KEY,
+            remote_path="/employees.csv",
+            content=buf,
+        )
+    finally:
+        text.close()
+
+
+def _resolve_missing_row(emp_id: str, prev_entry: dict) -> Optional[Dict[str, str]]:
+    """Fila a reenviar para alguien que ya no aparece en ChartHop (None si se salta)."""
+    prev_row = dict(prev_entry.get("row") or {})
+    end_prev = (prev_row.get("End Date") or "").strip()
+    if end_prev:
+        # ya teníamos una fecha de baja en el manifest previo: reenvía esa misma fila
+        return prev_row
+
+    ch_pid = (prev_entry.get("ch_person_id") or "").strip()
+    if not ch_pid:
+        # sin id de CH no podemos enriquecer: salta
+        return None
+
+    try:
+        url = f"{CH_API}/v2/org/{CH_ORG_ID}/person/{ch_pid}"
+        payload = _get_json(_SESSION, url, {"fields": "endDateOrg,contact.workEmail"})
+        if isinstance(payload, dict):
+            end_now = (payload.get("endDateOrg") or "").strip()
+            if end_now:
+                prev_row["End Date"] = end_now[:10]
+                if not prev_row.get("Email"):
+                    prev_row["Email"] = (payload.get("contact.workEmail") or "").strip()
+                # Asegura Employee Id por si se perdió
+                if not prev_row.get("Employee Id"):
+                    prev_row["Employee Id"] = prev_row.get("Email") or emp_id
+                return prev_row
+    except Exception:
+        # ruido de red/permiso; lo dejamos para la próxima corrida
+        pass
+    return None
 
 
 def _full_export(*, dry_run: bool = False) -> dict:
-    rows = build_culture_amp_rows()
-    csv_text = culture_amp_csv_from_rows(rows)
-    if not csv_text or csv_text.count("\n") <= 1:
-        raise RuntimeError("CSV vacío para Culture Amp")
-    _upload_csv(csv_text, dry_run=dry_run)
-
-    # Actualiza manifest con la foto completa (útil para cambiar a delta luego)
+    # Manifest con la foto completa (útil para cambiar a delta luego). Se arma
+    # mientras llegan las filas y el CSV se escribe desde él: es la única copia
+    # de la foto en memoria.
     current_meta: Dict[str, dict] = {}
-    for r in rows:
+    for r in iter_culture_amp_rows():
         emp_id = r["Employee Id"]
         current_meta[emp_id] = {
-            "hash": _row_hash(r),
+            "hash": row_hash(r),
             "ch_person_id": "",  # no lo tenemos aquí; se poblará en el primer delta
             "row": r,
         }
+    if not current_meta:
+        raise RuntimeError("CSV vacío para Culture Amp")
+    _upload_csv((meta["row"] for meta in current_meta.values()), dry_run=dry_run)
+
     if dry_run:
         logger.info("dry_run=True: skip save_state after full export")
     else:
-        save_state({"version": 1, "rows": current_meta})
+        save_state({"version": 1, "hash_algo": ROW_HASH_ALGO, "rows": current_meta})
 
     return {
-        "rows": len(rows),
+        "rows": len(current_meta),
         "remote_path": "/employees.csv",
         "mode": "full",
         "dry_run": dry_run,
@@ -87,16 +130,17 @@ def export_culture_amp_snapshot(*, dry_run: bool = False) -> dict:
     # --------- DELTA ----------
     prev = load_state() or {}
     prev_rows = (prev.get("rows") or {}) if isinstance(prev, dict) else {}
+    # Manifests con otro algoritmo (los viejos usaban sha256): se recalcula el
+    # hash previo desde la fila guardada en vez de reenviar todo.
+    rehash_prev = prev.get("hash_algo") != ROW_HASH_ALGO
 
     # Foto actual con ids de CH para poblar manifest
-    current: Dict[str, dict] = {}
     current_meta: Dict[str, dict] = {}
 
     for row, ch_pid in iter_culture_amp_rows_with_ids():
         emp_id = row["Employee Id"]
-        current[emp_id] = row
         current_meta[emp_id] = {
-            "hash": _row_hash(row),
+            "hash": row_hash(row),
             "ch_person_id": ch_pid,
             "row": row,
         }
@@ -106,86 +150,67 @@ def export_culture_amp_snapshot(*, dry_run: bool = False) -> dict:
     for emp_id, meta in current_meta.items():
         prev_meta = prev_rows.get(emp_id)
         if not prev_meta:
-            to_send[emp_id] = current[emp_id]
+            to_send[emp_id] = meta["row"]
             continue
-        if meta["hash"] != prev_meta.get("hash"):
-            to_send[emp_id] = current[emp_id]
+        if rehash_prev:
+            prev_hash = row_hash(prev_meta.get("row") or {})
+        else:
+            prev_hash = prev_meta.get("hash")
+        if meta["hash"] != prev_hash:
+            to_send[emp_id] = meta["row"]
 
     # faltantes (posibles bajas): estaban antes y ya no están
     missing_ids = set(prev_rows.keys()) - set(current_meta.keys())
     if missing_ids:
-        session = _new_session()
-        try:
-            for emp_id in missing_ids:
-                prev_entry = prev_rows.get(emp_id) or {}
-                prev_row = dict(prev_entry.get("row") or {})
-                end_prev = (prev_row.get("End Date") or "").strip()
-                if end_prev:
-                    # ya teníamos una fecha de baja en el manifest previo: reenvía esa misma fila
-                    to_send[emp_id] = prev_row
-                    continue
-
-                ch_pid = (prev_entry.get("ch_person_id") or "").strip()
-                if not ch_pid:
-                    # sin id de CH no podemos enriquecer: salta
-                    continue
-
-                try:
-                    url = f"{CH_API}/v2/org/{CH_ORG_ID}/person/{ch_pid}"
-                    payload = _get_json(session, url, {"fields": "endDateOrg,contact.workEmail"})
-                    if isinstance(payload, dict):
-                        end_now = (payload.get("endDateOrg") or "").strip()
-                        if end_now:
-                            prev_row["End Date"] = end_now[:10]
-                            if not prev_row.get("Email"):
-                                prev_row["Email"] = (payload.get("contact.workEmail") or "").strip()
-                            # Asegura Employee Id por si se perdió
-                            if not prev_row.get("Employee Id"):
-                                prev_row["Employee Id"] = prev_row.get("Email") or emp_id
-                            to_send[emp_id] = prev_row
-                except Exception:
-                    # ruido de red/permiso; lo dejamos para la próxima corrida
-                    pass
-        finally:
-            session.close()
+        # Cada baja posible se confirma con un GET independiente a ChartHop: se
+        # consultan en paralelo y se agregan en orden estable (por Employee Id).
+        missing = sorted(missing_ids)
+        resolved = _LOOKUP_EXECUTOR.map(
+            lambda emp_id: _resolve_missing_row(emp_id, prev_rows.get(emp_id) or {}),
+            missing,
+        )
+        for emp_id, row in zip(missing, resolved):
+            if row is not None:
+                to_send[emp_id] = row
 
     if not to_send:
         # Actualiza manifest igualmente con la foto actual
         new_manifest = {
             "version": 1,
+            "hash_algo": ROW_HASH_ALGO,
             "rows": {
                 eid: {
                     "hash": current_meta[eid]["hash"],
                     "ch_person_id": current_meta[eid]["ch_person_id"],
-                    "row": current[eid],
+                    "row": current_meta[eid]["row"],
                 }
-                for eid in current.keys()
+                for eid in current_meta.keys()
             },
         }
         if dry_run:
             logger.info("dry_run=True: skip save_state for delta manifest (no changes)")
+        elif new_manifest == prev:
+            # Sin cambios ni en filas ni en ids de ChartHop: no se reescribe el
+            # manifest (el objeto más grande del estado) en cada corrida.
+            logger.info("Culture Amp delta: manifest unchanged, skip save_state")
         else:
             save_state(new_manifest)
         return {"rows_sent": 0, "delta": True, "skipped": True, "dry_run": dry_run}
 
     # Genera CSV de delta y sube
-    csv_text = culture_amp_csv_from_rows(to_send.values())
-    if not csv_text or csv_text.count("\n") <= 1:
-        # En teoría puede pasar si todos eran líneas vacías; por seguridad no subimos
-        return {"rows_sent": 0, "delta": True, "skipped": True, "dry_run": dry_run}
-
-    _upload_csv(csv_text, dry_run=dry_run)
+    _upload_csv(to_send.values(), dry_run=dry_run)
 
     # Guarda el nuevo manifest (solo actuales; los faltantes desaparecen del estado)
     new_manifest = {
         "version": 1,
+        "hash_algo": ROW_HASH_ALGO,
         "rows": {
             eid: {
                 "hash": current_meta[eid]["hash"],
                 "ch_person_id": current_meta[eid]["ch_person_id"],
-                "row": current[eid],
+                "row": current_meta[eid]["row"],
             }
-            for eid in current.keys()
+            for eid in current_meta.keys()
         },
     }
     if dry_run:
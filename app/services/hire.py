@@ -1,22 +1,156 @@
 from __future__ import annotations
 
-from typing import Dict
-
-from app.clients.charthop import ch_import_people_csv, generate_unique_work_email
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.clients.charthop import (
+    ch_import_people_csv,
+    generate_unique_work_email,
+    release_work_email,
+)
 from app.clients.runn import runn_upsert_person
 from app.clients.teamtailor import tt_get_offer_start_date_for_application
-from app.utils.config import RUNN_CREATE_ON_HIRE
+from app.utils.config import (
+    CH_IMPORT_BATCH_MAX_ROWS,
+    CH_IMPORT_BATCH_SECONDS,
+    HTTP_TIMEOUT,
+    RUNN_CREATE_ON_HIRE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Las escrituras a ChartHop y Runn son independientes una vez calculado el
+# work email, así que se lanzan en paralelo.
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hire")
+
+# Tiempo máximo de ch_import_people_csv: hasta 3 POST secuenciales (create,
+# data y submit), cada uno con HTTP_TIMEOUT.
+_CH_IMPORT_TIMEOUT = 3 * HTTP_TIMEOUT
+
+# Micro-lote opcional de filas para el import CSV de ChartHop (desactivado por
+# defecto, ver CH_IMPORT_BATCH_SECONDS). Cada webhook agrega su fila y espera el
+# Future de su lote: el lote se envía al llenarse o cuando vence la ventana,
+# desde un threading.Timer que dispara mientras los requests siguen esperando.
+_CH_BATCH: List[Tuple[Dict, Future]] = []
+_CH_BATCH_LOCK = threading.Lock()
+# Si el lote falla, sus filas se reintentan una por una en paralelo (un hilo por
+# fila como máximo; el pool crea hilos solo cuando hacen falta).
+_CH_RETRY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, CH_IMPORT_BATCH_MAX_ROWS), thread_name_prefix="hire-retry"
+)
+
+
+def _take_ch_batch_locked() -> List[Tuple[Dict, Future]]:
+    batch = _CH_BATCH[:]
+    _CH_BATCH.clear()
+    return batch
+
+
+def _flush_ch_batch(batch: Optional[List[Tuple[Dict, Future]]] = None) -> None:
+    if batch is None:
+        with _CH_BATCH_LOCK:
+            batch = _take_ch_batch_locked()
+    if not batch:
+        return
+    if len(batch) == 1:
+        _import_row(*batch[0])
+        return
+    try:
+        result = ch_import_people_csv([row for row, _ in batch])
+    except Exception as exc:
+        # Una fila inválida o un POST fallido no debe tumbar a todo el lote:
+        # cada fila se reintenta sola y recibe su propio resultado.
+        logger.warning(
+            "hire charthop import: batch of %d rows failed (%r), retrying row by row",
+            len(batch),
+            exc,
+        )
+        for row, fut in batch:
+            _CH_RETRY_EXECUTOR.submit(_import_row, row, fut)
+        return
+    logger.info("hire charthop import: %d rows in one batch", len(batch))
+    for _, fut in batch:
+        fut.set_result(result)
+
+
+def _import_row(row: Dict, fut: Future) -> None:
+    try:
+        fut.set_result(ch_import_people_csv([row]))
+    except Exception as exc:
+        fut.set_exception(exc)
+
+
+def _batching_enabled() -> bool:
+    return CH_IMPORT_BATCH_SECONDS > 0 and CH_IMPORT_BATCH_MAX_ROWS > 1
+
+
+def _ch_import_wait_seconds() -> float:
+    """Espera máxima del import de una contratación (ventana + lote + reintento individual)."""
+    if not _batching_enabled():
+        return _CH_IMPORT_TIMEOUT + 5
+    return CH_IMPORT_BATCH_SECONDS + 2 * _CH_IMPORT_TIMEOUT + 5
+
 
+def _submit_ch_import(row: Dict) -> Future:
+    if not _batching_enabled():
+        return _EXECUTOR.submit(ch_import_people_csv, [row])
 
-def _resolve_candidate(included: list, type_name: str) -> Dict:
-    return next((item for item in included if item.get("type") == type_name), {}) or {}
+    fut: Future = Future()
+    with _CH_BATCH_LOCK:
+        _CH_BATCH.append((row, fut))
+        full = _take_ch_batch_locked() if len(_CH_BATCH) >= CH_IMPORT_BATCH_MAX_ROWS else None
+        opens_window = len(_CH_BATCH) == 1
+
+    if full:
+        _EXECUTOR.submit(_flush_ch_batch, full)
+    elif opens_window:
+        timer = threading.Timer(CH_IMPORT_BATCH_SECONDS, _flush_ch_batch)
+        timer.daemon = True
+        timer.start()
+    return fut
+
+
+def _included_by_type(included: list) -> Dict[str, Dict]:
+    """Primer recurso de cada tipo en `included` (una sola pasada)."""
+    by_type: Dict[str, Dict] = {}
+    for item in included:
+        if isinstance(item, dict) and item:
+            by_type.setdefault(item.get("type"), item)
+    return by_type
 
 
 def _extract_name(attributes: Dict, field: str) -> str:
     return attributes.get(field) or attributes.get(field.replace("-", "_")) or ""
 
 
-def process_hired_application(app_id: str, payload: Dict) -> Dict:
+def _future_result(future: Optional[Future], label: str) -> Tuple[Any, bool]:
+    """(resultado o {"error": ...}, si terminó sin error)."""
+    if future is None:
+        return None, True
+    if not future.done():
+        logger.error("hire %s: timeout", label)
+        return {"error": "timeout"}, False
+    exc = future.exception()
+    if exc is not None:
+        logger.error("hire %s error: %r", label, exc)
+        return {"error": repr(exc)}, False
+    return future.result(), True
+
+
+def process_hired_application(
+    app_id: str,
+    payload: Dict,
+    on_import_failed: Optional[Callable[[], None]] = None,
+) -> Dict:
+    """
+    Importa la contratación en ChartHop (y opcionalmente en Runn).
+
+    on_import_failed se llama cuando el import a ChartHop termina con error,
+    también si termina después de que este llamado ya devolvió por timeout
+    (en ese caso el resultado trae chartHopPending=True).
+    """
     data = payload.get("data") or {}
     attributes = data.get("attributes") or {}
     status = (attributes.get("status") or attributes.get("state") or "").lower()
@@ -25,8 +159,9 @@ def process_hired_application(app_id: str, payload: Dict) -> Dict:
         return {"processed": False, "reason": "application not hired"}
 
     included = payload.get("included") or []
-    candidate = _resolve_candidate(included, "candidates")
-    job = _resolve_candidate(included, "jobs")
+    by_type = _included_by_type(included)
+    candidate = by_type.get("candidates") or {}
+    job = by_type.get("jobs") or {}
 
     cand_attr = candidate.get("attributes") or {}
     job_attr = job.get("attributes") or {}
@@ -54,21 +189,47 @@ def process_hired_application(app_id: str, payload: Dict) -> Dict:
     if work_email:
         row["contact workemail"] = work_email
 
-    ch_result = ch_import_people_csv([row])
+    f_ch = _submit_ch_import(row)
+    if work_email:
+        # La reserva del email se libera cuando termina el import (aunque este
+        # request ya haya respondido por timeout); si el import falló, el email
+        # vuelve a estar disponible para el reintento.
+        f_ch.add_done_callback(lambda _f: release_work_email(work_email))
+    if on_import_failed is not None:
+
+        def _notify_failure(fut: Future) -> None:
+            if fut.exception() is not None:
+                on_import_failed()
+
+        f_ch.add_done_callback(_notify_failure)
 
-    runn_result = None
+    f_runn = None
     email_for_runn = work_email or personal_email or None
     if RUNN_CREATE_ON_HIRE and email_for_runn:
-        runn_result = runn_upsert_person(
+        f_runn = _EXECUTOR.submit(
+            runn_upsert_person,
             name=f"{first} {last}".strip(),
             email=email_for_runn,
             employment_type="employee",
             starts_at=start_date,
         )
 
-    return {
-        "processed": True,
+    wait(
+        [f for f in (f_ch, f_runn) if f is not None],
+        timeout=_ch_import_wait_seconds(),
+    )
+    ch_result, ch_ok = _future_result(f_ch, "charthop import")
+    runn_result, _ = _future_result(f_runn, "runn upsert")
+
+    result = {
+        # Sin import en ChartHop la contratación no quedó registrada
+        "processed": ch_ok,
         "chartHopImport": ch_result,
         "generatedWorkEmail": work_email,
         "runnResult": runn_result,
     }
+    if not ch_ok:
+        result["reason"] = "charthop import failed"
+        # Sigue en curso: puede terminar bien más tarde
+        result["chartHopPending"] = not f_ch.done()
+    return result
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 from app.clients.charthop import ch_find_job, ch_upsert_job_field
@@ -8,8 +9,13 @@ from app.clients.teamtailor import (
     tt_update_job,
     tt_upsert_job_custom_field,
 )
+from app.utils import _json
 from app.utils.config import CH_CF_JOB_TT_ID_LABEL
 
+# Una vez creado el job en TT, enlazarlo en TT y escribir el id de vuelta en CH
+# son independientes y se hacen en paralelo.
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job-sync")
+
 
 def _extract_job_title(job_payload: dict) -> str:
     title = job_payload.get("title") or ""
@@ -46,23 +52,28 @@ def sync_job_create(job_id: str) -> Optional[str]:
     print("sync_job_create TT status:", resp.status_code)
     if not resp.ok:
         return None
-    tt_job_id = ((resp.json() or {}).get("data") or {}).get("id")
+    tt_job_id = ((_json.loads(resp.content) or {}).get("data") or {}).get("id")
     if not tt_job_id:
         return None
+    f_tt = _EXECUTOR.submit(tt_upsert_job_custom_field, tt_job_id, job_id)
+    f_ch = None
+    if CH_CF_JOB_TT_ID_LABEL:
+        f_ch = _EXECUTOR.submit(ch_upsert_job_field, job_id, CH_CF_JOB_TT_ID_LABEL, tt_job_id)
     try:
-        tt_upsert_job_custom_field(tt_job_id, job_id)
+        f_tt.result()
     except Exception as exc:  # pragma: no cover - logging
         print("sync_job_create: failed linking TT custom field", repr(exc))
-    if CH_CF_JOB_TT_ID_LABEL:
+    if f_ch is not None:
         try:
-            ch_upsert_job_field(job_id, CH_CF_JOB_TT_ID_LABEL, tt_job_id)
+            f_ch.result()
         except Exception as exc:  # pragma: no cover - logging
             print("sync_job_create: failed writing TT id back to ChartHop", repr(exc))
     return tt_job_id
 
 
 def sync_job_update(job_id: str) -> bool:
-    job = ch_find_job(job_id)
+    # Un update necesita el estado actual del job, no una copia cacheada
+    job = ch_find_job(job_id, use_cache=False)
     if not job:
         print(f"sync_job_update: job {job_id} not found in ChartHop")
         return False
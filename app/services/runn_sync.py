@@ -3,16 +3,19 @@ from __future__ import annotations
 import datetime as dt
 import logging
 import os
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from app.clients.charthop import (
-    ch_fetch_timeoff_enriched,
+    ch_iter_timeoff_enriched,
     ch_get_timeoff,
     ch_get_person,
     ch_people_starting_between,
     ch_person_primary_email,
     _person_email,
     ch_fetch_people_by_ids,
+    ch_get_person_compensation,
+    ch_iter_people_v2,
 )
 from app.clients.runn import (
     runn_create_timeoff,
@@ -21,7 +24,8 @@ from app.clients.runn import (
     runn_update_timeoff,
     runn_upsert_person,
     runn_get_existing_leave,
-    runn_list_person_timeoffs,
+    runn_get_active_contracts,
+    runn_update_contract_cost,
 )
 from app.utils.timeoff_mapping import get_timeoff_mapping
 from app.utils.sync_metrics import get_sync_metrics
@@ -33,6 +37,11 @@ from app.utils.config import (
 
 logger = logging.getLogger(__name__)
 
+# Workers para los batch de onboarding y time-off: cada registro es
+# independiente y su costo es latencia HTTP (el rate limiter de Runn sigue
+# acotando el total de requests por minuto).
+_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="runn-batch")
+
 # -------------------------
 # Utilidades
 # -------------------------
@@ -54,7 +63,12 @@ def _safe_date(value: str) -> Optional[str]:
 
     # Validar formato YYYY-MM-DD
     try:
-        dt.datetime.strptime(date_str, "%Y-%m-%d")
+        # fromisoformat está en C; strptime (regex + locale) queda solo para
+        # formatos no canónicos que antes también se aceptaban (p. ej. 2024-1-5).
+        if len(date_str) == 10 and date_str[4] == "-" and date_str[7] == "-":
+            dt.date.fromisoformat(date_str)
+        else:
+            dt.datetime.strptime(date_str, "%Y-%m-%d")
         return date_str
     except ValueError:
         logger.warning(f"Invalid date format: {value}")
@@ -156,6 +170,41 @@ def _should_skip_timeoff(entry: Dict[str, Any]) -> Optional[str]:
 # Onboarding
 # -------------------------
 
+def _onboard_person(person: Dict[str, Any], reference: dt.date) -> Dict[str, Any]:
+    fields = person.get("fields") or {}
+    name = " ".join(
+        part
+        for part in [fields.get("name first"), fields.get("name last")]
+        if part
+    ).strip() or fields.get("name") or ""
+
+    email = ch_person_primary_email(person)
+    start_date = _safe_date(fields.get("start date") or fields.get("startdate") or "")
+
+    if not email:
+        return {
+            "person": name,
+            "status": "skipped",
+            "reason": "missing email"
+        }
+
+    # employment_type se mapea a role en Runn
+    employment_type = fields.get("employment type") or "employee"
+
+    runn_resp = runn_upsert_person(
+        name=name or email,
+        email=email,
+        employment_type=employment_type,
+        starts_at=start_date or reference.isoformat(),
+    )
+
+    return {
+        "person": name or email,
+        "status": "created" if runn_resp else "error",
+        "response": runn_resp
+    }
+
+
 def sync_runn_onboarding(reference: dt.date | None = None) -> Dict[str, Any]:
     """
     Sincroniza personas que comienzan dentro de la ventana de lookahead.
@@ -163,43 +212,10 @@ def sync_runn_onboarding(reference: dt.date | None = None) -> Dict[str, Any]:
     reference = reference or dt.date.today()
     end = reference + dt.timedelta(days=RUNN_ONBOARDING_LOOKAHEAD_DAYS)
     people = ch_people_starting_between(reference, end)
-    results: List[Dict[str, Any]] = []
-    
-    for person in people:
-        fields = person.get("fields") or {}
-        name = " ".join(
-            part
-            for part in [fields.get("name first"), fields.get("name last")]
-            if part
-        ).strip() or fields.get("name") or ""
-        
-        email = ch_person_primary_email(person)
-        start_date = _safe_date(fields.get("start date") or fields.get("startdate") or "")
-        
-        if not email:
-            results.append({
-                "person": name,
-                "status": "skipped",
-                "reason": "missing email"
-            })
-            continue
-        
-        # employment_type se mapea a role en Runn
-        employment_type = fields.get("employment type") or "employee"
-        
-        runn_resp = runn_upsert_person(
-            name=name or email,
-            email=email,
-            employment_type=employment_type,
-            starts_at=start_date or reference.isoformat(),
-        )
-        
-        results.append({
-            "person": name or email,
-            "status": "created" if runn_resp else "error",
-            "response": runn_resp
-        })
-    
+    results = list(
+        _BATCH_EXECUTOR.map(lambda person: _onboard_person(person, reference), people)
+    )
+
     return {
         "processed": len(people),
         "results": results
@@ -286,34 +302,6 @@ def sync_runn_onboarding_event(person_id: str) -> Dict[str, Any]:
 # Time off (v1.0)
 # -------------------------
 
-def _check_existing_timeoff(
-    person_id: int,
-    start_date: str,
-    end_date: str,
-    category: str
-) -> Optional[Dict[str, Any]]:
-    """
-    Verifica si ya existe un time-off similar.
-    En v1.0, la API hace merge automático de periodos que se traslapan,
-    pero igual verificamos para logging.
-    """
-    # Listar time-offs existentes del tipo correcto
-    existing = runn_list_person_timeoffs(person_id, category)
-    
-    for to in existing:
-        # Verificar si hay overlap de fechas
-        to_start = to.get("startDate", "")
-        to_end = to.get("endDate", "")
-        
-        # Overlap si:
-        # - El nuevo empieza antes de que termine el existente
-        # - El nuevo termina después de que empiece el existente
-        if to_start <= end_date and to_end >= start_date:
-            return to
-    
-    return None
-
-
 def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
     """
     Sincroniza un registro de time-off de ChartHop a Runn v1.0.
@@ -420,12 +408,37 @@ def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
     # 5) Verificar si ya existe un mapeo (para updates)
     mapping = get_timeoff_mapping()
     existing_mapping = mapping.get_runn_id(ext_id) if ext_id else None
+    # Huella de lo que se manda a Runn: si no cambió desde el último envío, el
+    # batch diario (que reprocesa toda la ventana) no repite el update.
+    synced = f"{category}|{person['id']}|{start_date}|{end_date or start_date}|{note or ''}"
+
+    if existing_mapping and existing_mapping["category"] != category:
+        # Cambió el tipo (p. ej. vacaciones -> enfermedad): en Runn cada tipo es
+        # un endpoint distinto, así que se borra el anterior y se crea de nuevo.
+        old_runn_id = existing_mapping["runn_id"]
+        if not runn_delete_timeoff(old_runn_id, existing_mapping["category"]):
+            return {
+                "status": "error",
+                "reason": "failed to delete time-off with previous category",
+                "entry_id": ext_id,
+                "runn_timeoff_id": old_runn_id,
+            }
+        mapping.remove(ext_id)
+        existing_mapping = None
 
     if existing_mapping:
         # Ya existe, actualizar en lugar de crear
         runn_id = existing_mapping["runn_id"]
         existing_category = existing_mapping["category"]
 
+        if existing_mapping.get("synced") == synced:
+            return {
+                "status": "skipped",
+                "reason": "unchanged since last sync",
+                "entry_id": ext_id,
+                "runn_timeoff_id": runn_id,
+            }
+
         logger.info(
             f"Time-off already mapped: ChartHop {ext_id} -> Runn {runn_id}, updating"
         )
@@ -438,6 +451,8 @@ def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
             end_date=end_date or start_date,
             note=note,
         )
+        if updated:
+            mapping.mark_synced(ext_id, synced)
 
         return {
             "status": "updated" if updated else "error",
@@ -450,23 +465,9 @@ def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
             "ext_ref": ext_id,
         }
 
-    # 6) Verificar si ya existe otro time-off en las mismas fechas (para logging)
-    existing = _check_existing_timeoff(
-        person_id=int(person["id"]),
-        start_date=start_date,
-        end_date=end_date or start_date,
-        category=category
-    )
-
-    if existing:
-        logger.info(
-            f"Time-off overlaps with existing entry (Runn will merge automatically): "
-            f"{email} {start_date} to {end_date}"
-        )
-        # No retornamos, dejamos que Runn haga el merge
-
-    # 7) Crear en Runn v1.0
-    # La API hace merge automático si hay overlap
+    # 6) Crear en Runn v1.0
+    # La API hace merge automático si hay overlap; no se lista antes lo que ya
+    # existe: el periodo que devuelve la respuesta indica si hubo merge.
     runn_response = runn_create_timeoff(
         person_id=int(person["id"]),
         start_date=start_date,
@@ -476,7 +477,21 @@ def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
         reason=reason,
     )
 
+    auto_merged = False
     if runn_response:
+        # Runn devuelve el periodo ya fusionado: si no coincide con el enviado,
+        # se unió con un time-off existente.
+        auto_merged = (
+            (runn_response.get("startDate") or start_date) != start_date
+            or (runn_response.get("endDate") or end_date or start_date)
+            != (end_date or start_date)
+        )
+        if auto_merged:
+            logger.info(
+                f"Time-off merged with existing entry by Runn: "
+                f"{email} {start_date} to {end_date}"
+            )
+
         # Guardar mapeo para futuras actualizaciones/eliminaciones
         runn_id = runn_response.get("id")
         if runn_id and ext_id:
@@ -484,7 +499,8 @@ def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
                 charthop_id=ext_id,
                 runn_id=runn_id,
                 category=category,
-                person_email=email
+                person_email=email,
+                synced=synced,
             )
 
     return {
@@ -497,10 +513,27 @@ def _sync_timeoff_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
         "start_date": start_date,
         "end_date": end_date or start_date,
         "ext_ref": ext_id,
-        "auto_merged": existing is not None,
+        "auto_merged": auto_merged,
     }
 
 
+def _unique_timeoffs(entries: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Descarta repeticiones del mismo time-off de ChartHop dentro de una corrida.
+    La paginación por offset puede devolver un registro dos veces si el listado
+    cambia entre páginas; procesadas en paralelo, ambas copias crearían el
+    time-off en Runn antes de que exista el mapeo.
+    """
+    seen: set[str] = set()
+    for entry in entries:
+        ext_id = str(entry.get("id") or (entry.get("fields") or {}).get("id") or "")
+        if ext_id:
+            if ext_id in seen:
+                continue
+            seen.add(ext_id)
+        yield entry
+
+
 def sync_runn_timeoff(reference: dt.date | None = None) -> Dict[str, Any]:
     """
     Sincroniza time-off de ChartHop a Runn dentro de la ventana configurada.
@@ -511,14 +544,13 @@ def sync_runn_timeoff(reference: dt.date | None = None) -> Dict[str, Any]:
     start = reference - dt.timedelta(days=RUNN_TIMEOFF_LOOKBACK_DAYS)
     end = reference + dt.timedelta(days=RUNN_TIMEOFF_LOOKAHEAD_DAYS)
 
-    events = ch_fetch_timeoff_enriched(start.isoformat(), end.isoformat())
-    results: List[Dict[str, Any]] = []
-
-    for entry in events:
-        results.append(_sync_timeoff_entry(entry))
+    # Los registros se sincronizan en paralelo a medida que llegan las páginas
+    # de ChartHop; el orden de resultados se conserva.
+    events = _unique_timeoffs(ch_iter_timeoff_enriched(start.isoformat(), end.isoformat()))
+    results: List[Dict[str, Any]] = list(_BATCH_EXECUTOR.map(_sync_timeoff_entry, events))
 
     summary = {
-        "processed": len(events),
+        "processed": len(results),
         "synced": sum(1 for r in results if r.get("status") == "synced"),
         "updated": sum(1 for r in results if r.get("status") == "updated"),
         "skipped": sum(1 for r in results if r.get("status") == "skipped"),
@@ -678,6 +710,9 @@ def delete_runn_timeoff_event(timeoff_id: str) -> Dict[str, Any]:
 # Compensación / Cost Per Hour
 # -------------------------
 
+# Workers para la sincronización batch de compensaciones (llamadas HTTP en paralelo)
+_COMPENSATION_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="runn-comp")
+
 # Horas anuales usadas para convertir CTC a costPerHour (configurable via env)
 RUNN_ANNUAL_HOURS = float(
     os.getenv(
@@ -734,13 +769,6 @@ def sync_runn_compensation_event(person_id: str) -> Dict[str, Any]:
             "runn_person_id": 456
         }
     """
-    from app.clients.charthop import ch_get_person_compensation
-    from app.clients.runn import (
-        runn_find_person_by_email,
-        runn_get_active_contracts,
-        runn_update_contract_cost,
-    )
-
     metrics = get_sync_metrics()
 
     person_id = (person_id or "").strip()
@@ -903,6 +931,127 @@ def sync_runn_compensation_event(person_id: str) -> Dict[str, Any]:
     }
 
 
+def _sync_person_compensation(person_id: str, reference_str: str) -> Tuple[Dict[str, Any], int]:
+    """Sincroniza la compensación de una persona; devuelve (resultado, contratos actualizados)."""
+    comp_data = ch_get_person_compensation(person_id)
+
+    if not comp_data:
+        return {
+            "person_id": person_id,
+            "status": "skipped",
+            "reason": "unable to load compensation data",
+        }, 0
+
+    email = comp_data.get("email", "")
+    job_id = comp_data.get("job_id")
+    cost_to_company = comp_data.get("cost_to_company")
+
+    if not email:
+        return {
+            "person_id": person_id,
+            "status": "skipped",
+            "reason": "missing email",
+            "job_id": job_id,
+        }, 0
+
+    if cost_to_company is None or cost_to_company <= 0:
+        return {
+            "person_id": person_id,
+            "email": email,
+            "status": "skipped",
+            "reason": "missing or invalid cost to company",
+            "job_id": job_id,
+        }, 0
+
+    # Calcular cost per hour
+    cost_per_hour = _calculate_cost_per_hour(cost_to_company)
+
+    if cost_per_hour <= 0:
+        return {
+            "person_id": person_id,
+            "email": email,
+            "status": "skipped",
+            "reason": "invalid cost per hour",
+            "job_id": job_id,
+            "cost_to_company": cost_to_company,
+        }, 0
+
+    # Buscar en Runn
+    runn_person = runn_find_person_by_email(email)
+
+    if not runn_person:
+        return {
+            "person_id": person_id,
+            "email": email,
+            "status": "skipped",
+            "reason": "person not found in Runn",
+            "job_id": job_id,
+        }, 0
+
+    runn_person_id = int(runn_person["id"])
+
+    # Obtener contratos activos
+    active_contracts = runn_get_active_contracts(
+        runn_person_id,
+        reference_date=reference_str
+    )
+
+    if not active_contracts:
+        return {
+            "person_id": person_id,
+            "email": email,
+            "runn_person_id": runn_person_id,
+            "status": "skipped",
+            "reason": "no active contracts",
+            "job_id": job_id,
+        }, 0
+
+    # Actualizar contratos
+    contracts_updated = 0
+    contracts_failed = 0
+
+    for contract in active_contracts:
+        contract_id = contract.get("id")
+        if not contract_id:
+            continue
+
+        # Verificar si ya tiene el mismo costo
+        current_cost = contract.get("costPerHour")
+        if current_cost is not None:
+            current_cost = round(float(current_cost), 2)
+            if current_cost == cost_per_hour:
+                continue
+
+        result = runn_update_contract_cost(contract_id, cost_per_hour)
+
+        if result:
+            contracts_updated += 1
+        else:
+            contracts_failed += 1
+
+    # Status
+    if contracts_updated > 0:
+        status = "synced"
+    elif contracts_failed > 0:
+        status = "error"
+    else:
+        status = "skipped"
+
+    return {
+        "person_id": person_id,
+        "email": email,
+        "name": comp_data.get("name"),
+        "status": status,
+        "cost_to_company": cost_to_company,
+        "cost_per_hour": cost_per_hour,
+        "currency": comp_data.get("currency"),
+        "runn_person_id": runn_person_id,
+        "contracts_updated": contracts_updated,
+        "contracts_failed": contracts_failed,
+        "job_id": job_id,
+    }, contracts_updated
+
+
 def sync_runn_compensation(reference: dt.date | None = None) -> Dict[str, Any]:
     """
     Sincronización batch de compensaciones.
@@ -923,153 +1072,33 @@ def sync_runn_compensation(reference: dt.date | None = None) -> Dict[str, Any]:
             "results": [...]
         }
     """
-    from app.clients.charthop import ch_get_person_compensation, ch_iter_people_v2
-    from app.clients.runn import (
-        runn_find_person_by_email,
-        runn_get_active_contracts,
-        runn_update_contract_cost,
-    )
-
     metrics = get_sync_metrics()
     reference = reference or dt.date.today()
     reference_str = reference.isoformat()
 
-    results: List[Dict[str, Any]] = []
-    total_contracts_updated = 0
-    processed = 0
-
-    for person in ch_iter_people_v2("id"):
-        person_id = (person.get("id") or "").strip()
-        if not person_id:
-            continue
-
-        processed += 1
-
-        comp_data = ch_get_person_compensation(person_id)
-
-        if not comp_data:
-            results.append({
-                "person_id": person_id,
-                "status": "skipped",
-                "reason": "unable to load compensation data",
-            })
-            continue
-
-        email = comp_data.get("email", "")
-        job_id = comp_data.get("job_id")
-        cost_to_company = comp_data.get("cost_to_company")
-
-        if not email:
-            results.append({
-                "person_id": person_id,
-                "status": "skipped",
-                "reason": "missing email",
-                "job_id": job_id,
-            })
-            continue
-
-        if cost_to_company is None or cost_to_company <= 0:
-            results.append({
-                "person_id": person_id,
-                "email": email,
-                "status": "skipped",
-                "reason": "missing or invalid cost to company",
-                "job_id": job_id,
-            })
-            continue
-
-        # Calcular cost per hour
-        cost_per_hour = _calculate_cost_per_hour(cost_to_company)
-
-        if cost_per_hour <= 0:
-            results.append({
-                "person_id": person_id,
-                "email": email,
-                "status": "skipped",
-                "reason": "invalid cost per hour",
-                "job_id": job_id,
-                "cost_to_company": cost_to_company,
-            })
-            continue
-
-        # Buscar en Runn
-        runn_person = runn_find_person_by_email(email)
-
-        if not runn_person:
-            results.append({
-                "person_id": person_id,
-                "email": email,
-                "status": "skipped",
-                "reason": "person not found in Runn",
-                "job_id": job_id,
-            })
-            continue
-
-        runn_person_id = int(runn_person["id"])
-
-        # Obtener contratos activos
-        active_contracts = runn_get_active_contracts(
-            runn_person_id,
-            reference_date=reference_str
+    # Cada persona implica varias llamadas HTTP independientes (CH + Runn): se
+    # procesan en paralelo conservando el orden de los resultados. map() recibe
+    # el generador del listado, así los workers arrancan con la primera página
+    # mientras las siguientes todavía se descargan.
+    person_ids = (
+        person_id
+        for person_id in (
+            (person.get("id") or "").strip()
+            for person in ch_iter_people_v2("id")
         )
+        if person_id
+    )
 
-        if not active_contracts:
-            results.append({
-                "person_id": person_id,
-                "email": email,
-                "runn_person_id": runn_person_id,
-                "status": "skipped",
-                "reason": "no active contracts",
-                "job_id": job_id,
-            })
-            continue
-
-        # Actualizar contratos
-        contracts_updated = 0
-        contracts_failed = 0
-
-        for contract in active_contracts:
-            contract_id = contract.get("id")
-            if not contract_id:
-                continue
-
-            # Verificar si ya tiene el mismo costo
-            current_cost = contract.get("costPerHour")
-            if current_cost is not None:
-                current_cost = round(float(current_cost), 2)
-                if current_cost == cost_per_hour:
-                    continue
-
-            result = runn_update_contract_cost(contract_id, cost_per_hour)
-
-            if result:
-                contracts_updated += 1
-            else:
-                contracts_failed += 1
-
+    results: List[Dict[str, Any]] = []
+    total_contracts_updated = 0
+    outcomes = _COMPENSATION_EXECUTOR.map(
+        lambda person_id: _sync_person_compensation(person_id, reference_str),
+        person_ids,
+    )
+    for result, contracts_updated in outcomes:
+        results.append(result)
         total_contracts_updated += contracts_updated
-
-        # Status
-        if contracts_updated > 0:
-            status = "synced"
-        elif contracts_failed > 0:
-            status = "error"
-        else:
-            status = "skipped"
-
-        results.append({
-            "person_id": person_id,
-            "email": email,
-            "name": comp_data.get("name"),
-            "status": status,
-            "cost_to_company": cost_to_company,
-            "cost_per_hour": cost_per_hour,
-            "currency": comp_data.get("currency"),
-            "runn_person_id": runn_person_id,
-            "contracts_updated": contracts_updated,
-            "contracts_failed": contracts_failed,
-            "job_id": job_id,
-        })
+    processed = len(results)
 
     summary = {
         "processed": processed,
@@ -8,6 +8,7 @@ from app.services.ctc_calculator import (
     batch_calculate_and_update_ch_ctc,
     calculate_and_update_ch_ctc,
 )
+from app.services.job_sync import sync_job_create, sync_job_update
 from app.services.runn_sync import (
     delete_runn_timeoff_event,
     sync_runn_compensation,
@@ -48,6 +49,10 @@ def run_charthop_worker():
         result = calculate_and_update_ch_ctc(entity_id)
     elif kind == "ctc_recalculate_batch":
         result = batch_calculate_and_update_ch_ctc()
+    elif kind == "job_create":
+        result = {"tt_job_id": sync_job_create(entity_id)}
+    elif kind == "job_update":
+        result = {"updated": sync_job_update(entity_id)}
     else:
         result = {"status": "ignored", "reason": "unknown kind", "kind": kind, "entity_id": entity_id}
 
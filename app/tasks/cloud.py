@@ -1,12 +1,26 @@
 from __future__ import annotations
 
-import json
 import os
 from typing import Any, Dict, Optional
 
+from app.utils import _json
+
 # Cloud Tasks client se importa bajo demanda para no romper local si falta la lib.
 _tasks_v2 = None
 
+# Snapshot de las variables de entorno usadas al encolar (se leen una vez al
+# importar). Usa refresh_env() si cambian en caliente (p. ej. en tests).
+_ENV_KEYS = ("GCP_PROJECT", "GOOGLE_CLOUD_PROJECT", "TASKS_LOCATION", "SERVICE_URL")
+_ENV: Dict[str, str] = {}
+
+
+def refresh_env() -> None:
+    """Vuelve a leer las variables de entorno usadas por enqueue_http_task."""
+    _ENV.update({key: os.environ.get(key, "") for key in _ENV_KEYS})
+
+
+refresh_env()
+
 def _require_tasks():
     global _tasks_v2
     if _tasks_v2 is not None:
@@ -40,7 +54,7 @@ def enqueue_http_task(
 
     tasks_v2 = _require_tasks()
 
-    project = (project or os.environ.get("GCP_PROJECT") or os.environ.get("GOOGLE_CLOUD_PROJECT") or "").strip()
+    project = (project or _ENV["GCP_PROJECT"] or _ENV["GOOGLE_CLOUD_PROJECT"] or "").strip()
     if not project:
         raise RuntimeError("Falta GCP_PROJECT/GOOGLE_CLOUD_PROJECT")
 
@@ -49,9 +63,9 @@ def enqueue_http_task(
         raise RuntimeError("Falta el nombre de la cola (queue)")
 
     # IMPORTANTE: Cloud Tasks no soporta 'northamerica-south1'. Usa, por ejemplo, us-central1.
-    location = (location or os.environ.get("TASKS_LOCATION") or "us-central1").strip()
+    location = (location or _ENV["TASKS_LOCATION"] or "us-central1").strip()
 
-    base_url = (service_url or os.environ.get("SERVICE_URL") or "").strip().rstrip("/")
+    base_url = (service_url or _ENV["SERVICE_URL"] or "").strip().rstrip("/")
     if not base_url:
         raise RuntimeError("Falta SERVICE_URL (la URL pública de tu servicio de Cloud Run)")
 
@@ -60,7 +74,7 @@ def enqueue_http_task(
     if headers:
         http_headers.update(headers)
 
-    body_bytes = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    body_bytes = _json.dumps(payload)
 
     client = tasks_v2.CloudTasksClient()
     parent = client.queue_path(project, location, queue)
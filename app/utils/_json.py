@@ -0,0 +1,34 @@
+"""
+Serialización JSON compartida (estado en GCS y respuestas HTTP).
+
+Usa orjson cuando está instalado (más rápido y produce bytes directamente) y
+cae a la librería estándar si no lo está.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover - depende del entorno
+    orjson = None
+
+JSONDecodeError = json.JSONDecodeError  # orjson.JSONDecodeError hereda de esta
+
+
+def dumps(obj: Any, *, sort_keys: bool = False) -> bytes:
+    """Serializa a JSON compacto en UTF-8 (con sort_keys, salida determinista)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(
+        obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys
+    ).encode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """Parsea JSON desde str o bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,9 +1,11 @@
 import os
 import hmac
-import hashlib
 import base64
+import string
 import unicodedata
-from typing import Tuple
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Tuple
 
 
 def _int_env(var_name: str, default: int) -> int:
@@ -33,6 +35,11 @@ DEFAULT_LOCALE = os.getenv("DEFAULT_LOCALE", "es-LA")
 DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "UTC")
 CORP_EMAIL_DOMAIN = os.getenv("CORP_EMAIL_DOMAIN")
 AUTO_ASSIGN_WORK_EMAIL = os.getenv("AUTO_ASSIGN_WORK_EMAIL", "false").lower() in ("1", "true", "yes", "on")
+# Opcional: contrataciones que llegan juntas se agrupan en un solo import CSV; se
+# espera hasta CH_IMPORT_BATCH_SECONDS o CH_IMPORT_BATCH_MAX_ROWS filas. Por
+# defecto (0) cada contratación se importa sola, sin esperar.
+CH_IMPORT_BATCH_SECONDS = float(os.getenv("CH_IMPORT_BATCH_SECONDS", "0"))
+CH_IMPORT_BATCH_MAX_ROWS = _int_env("CH_IMPORT_BATCH_MAX_ROWS", 50)
 
 # Custom fields para sincronizar IDs cruzados
 TT_CF_JOB_CH_ID = os.getenv("TT_CF_JOB_CH_ID")
@@ -72,72 +79,104 @@ CA_SFTP_PASSPHRASE = os.getenv("CA_SFTP_PASSPHRASE")
 CA_SFTP_PATH = os.getenv("CA_SFTP_PATH", "/upload")
 
 
-def ch_headers():
-    return {"Authorization": f"Bearer {CH_API_TOKEN}"}
+# Los tokens no cambian después del import: los headers se construyen una vez
+# y se exponen como mappings de solo lectura. Quien necesite mutarlos debe
+# copiarlos con dict(...).
+_CH_HEADERS = MappingProxyType({"Authorization": f"Bearer {CH_API_TOKEN}"})
 
+_TT_HEADERS = MappingProxyType({
+    "Authorization": f"Token token={TT_API_KEY}",
+    "X-Api-Version": TT_API_VERSION,
+    "Content-Type": "application/vnd.api+json",
+})
 
-def tt_headers():
-    return {
-        "Authorization": f"Token token={TT_API_KEY}",
-        "X-Api-Version": TT_API_VERSION,
-        "Content-Type": "application/vnd.api+json",
-    }
+_RUNN_HEADERS = MappingProxyType({
+    "Authorization": f"Bearer {RUNN_API_TOKEN}",
+    "Accept-Version": RUNN_API_VERSION,
+    "Content-Type": "application/json",
+})
 
 
-def runn_headers():
-    return {
-        "Authorization": f"Bearer {RUNN_API_TOKEN}",
-        "Accept-Version": RUNN_API_VERSION,
-        "Content-Type": "application/json",
-    }
+def ch_headers() -> Mapping[str, str]:
+    return _CH_HEADERS
+
+
+def tt_headers() -> Mapping[str, str]:
+    return _TT_HEADERS
+
+
+def runn_headers() -> Mapping[str, str]:
+    return _RUNN_HEADERS
+
+
+# Llave de firma de Teamtailor ya codificada (no depende del request).
+_TT_SIGNATURE_KEY_BYTES = TT_SIGNATURE_KEY.encode() if TT_SIGNATURE_KEY else None
 
 
 def tt_verify_signature(resource_id: str, provided_header: str) -> bool:
-    if not TT_SIGNATURE_KEY:
+    if _TT_SIGNATURE_KEY_BYTES is None:
         return True
-    mac_hex = hmac.new(TT_SIGNATURE_KEY.encode(), resource_id.encode(), hashlib.sha256).hexdigest()
-    expected = base64.b64encode(mac_hex.encode()).decode()
-    return hmac.compare_digest(provided_header or "", expected)
+    try:
+        provided = (provided_header or "").encode("ascii")
+    except UnicodeEncodeError:
+        return False
+    mac = hmac.digest(_TT_SIGNATURE_KEY_BYTES, resource_id.encode(), "sha256")
+    expected = base64.b64encode(mac.hex().encode("ascii"))
+    return hmac.compare_digest(provided, expected)
+
 
+# Tablas para bytes.translate: pasa a minúsculas y borra todo lo que no sea [a-z0-9]
+_ASCII_LOWER = bytes.maketrans(string.ascii_uppercase.encode(), string.ascii_lowercase.encode())
+_ASCII_NON_ALNUM = bytes(
+    b for b in range(256) if not chr(b).isascii() or not chr(b).isalnum()
+)
 
+
+@lru_cache(maxsize=4096)
 def strip_accents_and_non_alnum(value: str) -> str:
-    normalized = unicodedata.normalize("NFKD", (value or ""))
-    ascii_only = normalized.encode("ascii", "ignore").decode("ascii")
-    return "".join(ch for ch in ascii_only.lower() if ch.isalnum())
+    if not value:
+        return ""
+    # Nombres ya ASCII no necesitan normalización
+    if not value.isascii():
+        value = unicodedata.normalize("NFKD", value)
+    ascii_only = value.encode("ascii", "ignore")
+    return ascii_only.translate(_ASCII_LOWER, _ASCII_NON_ALNUM).decode("ascii")
+
+
+_LOCALE_MAP = MappingProxyType({
+    "MX": "es-MX",
+    "CR": "es-CR",
+    "CO": "es-CO",
+    "AR": "es-AR",
+    "CL": "es-CL",
+    "US": "en-US",
+    "ES": "es-ES",
+    "BR": "pt-BR",
+})
+_TZ_MAP = MappingProxyType({
+    "MX": "America/Mexico_City",
+    "CR": "America/Costa_Rica",
+    "CO": "America/Bogota",
+    "AR": "America/Argentina/Buenos_Aires",
+    "CL": "America/Santiago",
+    "US": "America/Los_Angeles",
+    "ES": "Europe/Madrid",
+    "BR": "America/Sao_Paulo",
+})
 
 
 def derive_locale_timezone(country_code: str) -> Tuple[str, str]:
     if not country_code:
         return DEFAULT_LOCALE, DEFAULT_TIMEZONE
     cc = country_code.strip().upper()
-    locale_map = {
-        "MX": "es-MX",
-        "CR": "es-CR",
-        "CO": "es-CO",
-        "AR": "es-AR",
-        "CL": "es-CL",
-        "US": "en-US",
-        "ES": "es-ES",
-        "BR": "pt-BR",
-    }
-    tz_map = {
-        "MX": "America/Mexico_City",
-        "CR": "America/Costa_Rica",
-        "CO": "America/Bogota",
-        "AR": "America/Argentina/Buenos_Aires",
-        "CL": "America/Santiago",
-        "US": "America/Los_Angeles",
-        "ES": "Europe/Madrid",
-        "BR": "America/Sao_Paulo",
-    }
-    return locale_map.get(cc, DEFAULT_LOCALE), tz_map.get(cc, DEFAULT_TIMEZONE)
+    return _LOCALE_MAP.get(cc, DEFAULT_LOCALE), _TZ_MAP.get(cc, DEFAULT_TIMEZONE)
 
 
 def compose_location(state_or_city: str, country_code: str) -> str:
+    if not state_or_city and not country_code:
+        return ""
     state = (state_or_city or "").strip()
     cc = (country_code or "").strip()
     if state and cc:
-        return f"{state}, {cc}"
-    if cc:
-        return cc
-    return state
+        return state + ", " + cc
+    return cc or state
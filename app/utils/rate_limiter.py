@@ -2,9 +2,10 @@
 
 from __future__ import annotations
 
+import threading
 import time
 from collections import deque
-from typing import Any, Callable, Dict, Optional, TypeVar
+from typing import Any, Callable, Dict, Mapping, Optional, TypeVar
 
 T = TypeVar("T")
 
@@ -27,6 +28,16 @@ class RateLimiter:
         self.max_requests = max_requests
         self.window = window_seconds
         self.requests = deque()
+        # Compartido entre hilos (sync batch en paralelo): la espera se hace con
+        # el lock tomado para que los hilos no se salten el límite.
+        self._lock = threading.Lock()
+        # Instante antes del cual no se debe enviar otro request (según los
+        # headers X-RateLimit-* de la última respuesta; 0 = sin restricción)
+        self._not_before = 0.0
+        # Con la cuota baja, cada request usa un turno y corre _not_before en
+        # este intervalo hasta el reset (o hasta que otra respuesta lo ajuste).
+        self._pace_interval = 0.0
+        self._pace_until = 0.0
 
     def wait_if_needed(self) -> float:
         """
@@ -35,7 +46,53 @@ class RateLimiter:
         Returns:
             Tiempo esperado en segundos (0 si no hubo que esperar)
         """
+        with self._lock:
+            return self._wait_locked()
+
+    def observe_headers(self, headers: Mapping[str, str], low_watermark: int = 5) -> None:
+        """
+        Ajusta el ritmo con los headers X-RateLimit-Remaining/Reset de una respuesta.
+
+        Cuando quedan menos de `low_watermark` requests en la ventana del
+        servidor, reparte los restantes hasta el reset en vez de esperar al 429.
+        Reset se acepta como epoch o como segundos restantes.
+        """
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining_n = int(remaining)
+            reset_at = float(reset)
+        except ValueError:
+            return
+        if remaining_n >= low_watermark:
+            with self._lock:
+                self._pace_interval = 0.0
+            return
+
+        now = time.time()
+        reset_in = reset_at - now if reset_at > 1e9 else reset_at
+        if reset_in <= 0:
+            return
+        interval = reset_in / (max(remaining_n, 0) + 1)
+        with self._lock:
+            self._pace_interval = interval
+            self._pace_until = now + reset_in
+            self._not_before = max(self._not_before, now + interval)
+
+    def _wait_locked(self) -> float:
+        paced = self._not_before - time.time()
+        if paced > 0:
+            time.sleep(paced)
+        else:
+            paced = 0.0
+
         now = time.time()
+        if self._pace_interval and now < self._pace_until:
+            # Este request toma el turno: el siguiente espera un intervalo más,
+            # así los hilos en espera no salen todos juntos al vencer el turno.
+            self._not_before = max(self._not_before, now) + self._pace_interval
 
         # Limpiar requests fuera de la ventana
         while self.requests and self.requests[0] < now - self.window:
@@ -54,7 +111,7 @@ class RateLimiter:
             waited = 0.0
 
         self.requests.append(time.time())
-        return waited
+        return waited + paced
 
 
 class TimedCache:
@@ -106,6 +163,15 @@ class TimedCache:
         """
         self._cache[key] = (time.time(), value)
 
+    def delete(self, key: str) -> None:
+        """
+        Elimina una clave del caché (no falla si no existe).
+
+        Args:
+            key: Clave del caché
+        """
+        self._cache.pop(key, None)
+
     def clear(self) -> None:
         """Limpia todo el caché."""
         self._cache.clear()
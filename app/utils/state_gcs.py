@@ -1,17 +1,45 @@
 from __future__ import annotations
-import json
+import hashlib
 import os
-from typing import Dict, Any, Optional
+import uuid
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
 
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from google.cloud import storage
 
+from app.utils import _json
+
+try:  # xxhash es opcional: si no está instalado se usa blake2b de la stdlib
+    import xxhash  # type: ignore
+except Exception:  # pragma: no cover - depende del entorno
+    xxhash = None
+
 _BUCKET = os.environ.get("CA_STATE_BUCKET", "")
 _MISSING = object()
 
+# Algoritmo usado para el campo "hash" de cada fila del manifest. Se guarda en el
+# estado para detectar manifests generados con otro algoritmo (p. ej. sha256).
+ROW_HASH_ALGO = "xxh3_64" if xxhash is not None else "blake2b_64"
+
+@lru_cache(maxsize=1)
 def _client() -> storage.Client:
+    # El cliente resuelve credenciales y proyecto al construirse: se crea una
+    # sola vez por proceso (es thread-safe) en lugar de en cada lectura/escritura.
     return storage.Client()
 
 
+def row_hash(row: dict) -> str:
+    """
+    Hash estable (no criptográfico) para detectar cambios en una fila.
+    Usa solo el contenido de la fila (orden de claves determinista).
+    """
+    canonical = _json.dumps(row, sort_keys=True)
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(canonical)
+    return hashlib.blake2b(canonical, digest_size=8).hexdigest()
+
+
 def get_state(object_path: str) -> Optional[Any]:
     """
     Lee un archivo de estado desde GCS.
@@ -29,29 +57,34 @@ def get_state(object_path: str) -> Optional[Any]:
         cli = _client()
         bkt = cli.bucket(_BUCKET)
         blob = bkt.blob(object_path)
-        
-        if not blob.exists():
+
+        # Descarga directa: un objeto inexistente responde 404 (NotFound) sin
+        # pagar un round-trip extra de exists() en cada lectura.
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
             return None
-        
-        data = blob.download_as_text(encoding="utf-8")
-        
+
         # Intentar parsear como JSON
         try:
-            return json.loads(data)
-        except json.JSONDecodeError:
-            return data
+            return _json.loads(data)
+        except _json.JSONDecodeError:
+            return data.decode("utf-8")
     except Exception as e:
         print(f"Error loading state from GCS ({object_path}): {e}")
         return None
 
 
-def save_state(object_path: Any, data: Any = _MISSING) -> None:
+def save_state(object_path: Any, data: Any = _MISSING) -> bool:
     """
     Guarda datos en GCS.
 
     Args:
         object_path: Ruta del objeto en el bucket
-        data: Datos a guardar (dict, list, o string)
+        data: Datos a guardar (dict, list, string o bytes JSON ya serializados)
+
+    Returns:
+        True si se guardó, False si no (bucket sin configurar o error)
     """
     if data is _MISSING:
         data = object_path
@@ -61,30 +94,136 @@ def save_state(object_path: Any, data: Any = _MISSING) -> None:
 
     if not _BUCKET:
         print(f"Warning: CA_STATE_BUCKET not set, cannot save state to {object_path}")
-        return
+        return False
 
     try:
         cli = _client()
         bkt = cli.bucket(_BUCKET)
         blob = bkt.blob(object_path)
 
-        # Convertir a string si es necesario
-        if isinstance(data, (dict, list)):
-            content = json.dumps(
-                data,
-                ensure_ascii=False,
-                separators=(",", ":"),
-                sort_keys=True,
-            )
+        # Convertir a bytes si es necesario (bytes ya serializados pasan directo)
+        if isinstance(data, (bytes, bytearray)):
+            content = bytes(data)
+        elif isinstance(data, (dict, list)):
+            content = _json.dumps(data, sort_keys=True)
         else:
-            content = str(data)
+            content = str(data).encode("utf-8")
 
         blob.upload_from_string(
-            content.encode("utf-8"),
+            content,
             content_type="application/json; charset=utf-8",
         )
+        return True
     except Exception as e:
         print(f"Error saving state to GCS ({object_path}): {e}")
+        return False
+
+
+def get_state_raw(object_path: str) -> Optional[bytes]:
+    """
+    Lee un archivo de estado desde GCS sin interpretarlo.
+
+    Returns:
+        Contenido en bytes o None si no existe (o si falla la lectura)
+    """
+    if not _BUCKET:
+        return None
+
+    try:
+        blob = _client().bucket(_BUCKET).blob(object_path)
+        try:
+            return blob.download_as_bytes()
+        except NotFound:
+            return None
+    except Exception as e:
+        print(f"Error loading raw state from GCS ({object_path}): {e}")
+        return None
+
+
+def get_state_raw_with_generation(object_path: str) -> Optional[Tuple[bytes, int]]:
+    """
+    Como get_state_raw, pero devuelve también la generación leída del objeto
+    (0 si no existe) para escrituras/borrados condicionados.
+
+    Returns:
+        (contenido, generación) o None si falla la lectura
+    """
+    if not _BUCKET:
+        return None
+
+    try:
+        blob = _client().bucket(_BUCKET).blob(object_path)
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return b"", 0
+        return data, int(blob.generation or 0)
+    except Exception as e:
+        print(f"Error loading raw state from GCS ({object_path}): {e}")
+        return None
+
+
+def append_state(object_path: str, data: bytes) -> Optional[int]:
+    """
+    Agrega bytes al final de un objeto de GCS.
+
+    Los objetos de GCS son inmutables: se sube un objeto temporal con los bytes
+    nuevos y se hace compose [objeto, temporal] sobre el mismo objeto.
+
+    Returns:
+        Número de componentes del objeto resultante (GCS admite hasta 1024,
+        conviene compactar antes) o None si no se pudo escribir
+    """
+    if not _BUCKET:
+        print(f"Warning: CA_STATE_BUCKET not set, cannot append state to {object_path}")
+        return None
+
+    try:
+        bkt = _client().bucket(_BUCKET)
+        blob = bkt.blob(object_path)
+
+        # Caso común: el objeto ya existe y se compone directo, sin exists()
+        # previo. Si no existe, compose responde 404 y se crea con estos bytes.
+        part = bkt.blob(f"{object_path}.part-{uuid.uuid4().hex}")
+        part.upload_from_string(data, content_type="application/x-ndjson")
+        try:
+            blob.compose([blob, part])
+        except NotFound:
+            blob.upload_from_string(data, content_type="application/x-ndjson")
+            return 1
+        finally:
+            try:
+                part.delete()
+            except Exception:
+                pass
+        return blob.component_count or 1
+    except Exception as e:
+        print(f"Error appending state to GCS ({object_path}): {e}")
+        return None
+
+
+def delete_state(object_path: str, if_generation_match: Optional[int] = None) -> bool:
+    """
+    Elimina un archivo de estado de GCS (no falla si no existe).
+
+    Con if_generation_match solo borra esa generación: si el objeto cambió o
+    ya no existe, no borra nada y devuelve False.
+    """
+    if not _BUCKET:
+        return False
+
+    try:
+        blob = _client().bucket(_BUCKET).blob(object_path)
+        try:
+            blob.delete(if_generation_match=if_generation_match)
+        except PreconditionFailed:
+            return False
+        except NotFound:
+            return if_generation_match is None
+        return True
+    except Exception as e:
+        print(f"Error deleting state from GCS ({object_path}): {e}")
+        return False
 
 
 # Mantener compatibilidad con código existente de Culture Amp
@@ -6,23 +6,59 @@ Permite trackear estadísticas de sincronización para debugging y análisis.
 
 from __future__ import annotations
 
+import atexit
 import datetime as dt
-import json
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import Any, Dict, Optional
 
-from app.utils.state_gcs import get_state, save_state
+from app.utils import _json
+from app.utils.state_gcs import append_state, get_state, get_state_raw, save_state
 
 logger = logging.getLogger(__name__)
 
+# Cada sección vive en su propio objeto de GCS: un cambio de contador solo
+# reescribe el blob (chico) de contadores y los errores se agregan a un log JSONL.
+METRICS_COUNTERS_KEY = "sync_metrics_counters.json"
+METRICS_LAST_SYNC_KEY = "sync_metrics_last_sync.json"
+METRICS_ERRORS_KEY = "sync_metrics_errors.jsonl"
+
+# Blob único anterior; solo se lee si todavía no existen los objetos separados
 METRICS_STATE_KEY = "sync_metrics.json"
 
+# Lecturas de las secciones en la carga inicial (una vez por proceso)
+_LOAD_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="metrics-load")
+
+# Las escrituras a GCS se agrupan: se hace flush cada N cambios o cada T segundos
+# (y siempre al final del request / al salir del proceso).
+FLUSH_EVERY_OPS = 50
+FLUSH_EVERY_SECONDS = 2.0
+
+# Número máximo de errores recientes que se conservan
+MAX_RECENT_ERRORS = 100
+
+# El log de errores se reescribe con solo los recientes al pasar estos umbrales
+# (GCS limita un objeto compuesto a 1024 componentes).
+COMPACT_ERRORS_AFTER_LINES = 5 * MAX_RECENT_ERRORS
+COMPACT_ERRORS_AFTER_COMPONENTS = 900
+
+_UTC = dt.timezone.utc
+
+
+def _now_iso() -> str:
+    """Timestamp actual en UTC, formato ISO 8601 con sufijo Z."""
+    return dt.datetime.now(_UTC).isoformat(timespec="seconds").replace("+00:00", "Z")
+
 
 class SyncMetrics:
     """
     Trackea métricas de sincronización.
 
-    Estructura:
+    Estructura lógica (en GCS cada sección se guarda en un objeto aparte):
     {
         "last_sync": {
             "timeoff": "2025-10-28T12:00:00Z",
@@ -48,31 +84,158 @@ class SyncMetrics:
     """
 
     def __init__(self):
-        self._metrics: Dict[str, Any] = self._load_metrics()
-
-    def _load_metrics(self) -> Dict[str, Any]:
-        """Carga métricas desde GCS."""
-        try:
-            data = get_state(METRICS_STATE_KEY)
-            if data:
-                parsed = json.loads(data) if isinstance(data, str) else data
-                return parsed
-        except Exception as e:
-            logger.warning(f"Could not load sync metrics from GCS: {e}")
-
-        # Estructura por defecto
+        # La carga desde GCS se difiere hasta la primera lectura (o flush): las
+        # escrituras previas se acumulan en _pending y se combinan al cargar.
+        self._loaded: Optional[Dict[str, Any]] = None
+        self._pending: Dict[str, Any] = self._empty_metrics()
+        self._dirty_sections: set[str] = set()
+        self._pending_errors: list[Dict[str, Any]] = []
+        self._error_log_lines = 0
+        self._error_log_components = 0
+        self._dirty_count = 0
+        self._last_flush = time.monotonic()
+        # Los requests se atienden en varios hilos: flush no debe correr en paralelo
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, Any]:
         return {
             "last_sync": {},
             "counters": {},
-            "last_errors": []
+            "last_errors": deque(maxlen=MAX_RECENT_ERRORS)
         }
 
-    def _save_metrics(self) -> None:
-        """Guarda métricas a GCS."""
+    @property
+    def _metrics(self) -> Dict[str, Any]:
+        """Métricas completas; carga desde GCS y combina lo pendiente si hace falta."""
+        if self._loaded is not None:
+            return self._loaded
+        with self._lock:
+            return self._load_and_merge()
+
+    def _load_and_merge(self) -> Dict[str, Any]:
+        if self._loaded is None:
+            loaded = self._load_metrics()
+            pending = self._pending
+            loaded["last_sync"].update(pending["last_sync"])
+            for name, amount in pending["counters"].items():
+                loaded["counters"][name] = loaded["counters"].get(name, 0) + amount
+            for error_entry in reversed(pending["last_errors"]):
+                loaded["last_errors"].appendleft(error_entry)
+            self._loaded = loaded
+            self._pending = self._empty_metrics()
+        return self._loaded
+
+    def _target(self) -> Dict[str, Any]:
+        """Estructura donde aplicar escrituras sin forzar la carga desde GCS."""
+        return self._loaded if self._loaded is not None else self._pending
+
+    def _load_metrics(self) -> Dict[str, Any]:
+        """Carga métricas desde GCS (una sección por objeto)."""
+        metrics = self._empty_metrics()
+        try:
+            # Las tres secciones son objetos independientes: se leen en paralelo
+            f_counters = _LOAD_EXECUTOR.submit(get_state, METRICS_COUNTERS_KEY)
+            f_last_sync = _LOAD_EXECUTOR.submit(get_state, METRICS_LAST_SYNC_KEY)
+            errors_log = get_state_raw(METRICS_ERRORS_KEY)
+            counters = f_counters.result()
+            last_sync = f_last_sync.result()
+            if counters is None and last_sync is None and errors_log is None:
+                return self._load_legacy_metrics()
+            if isinstance(counters, dict):
+                metrics["counters"] = counters
+            if isinstance(last_sync, dict):
+                metrics["last_sync"] = last_sync
+            lines = [line for line in (errors_log or b"").splitlines() if line.strip()]
+            self._error_log_lines = len(lines)
+            # El log está en orden cronológico; el deque guarda el más reciente primero
+            for line in lines[-MAX_RECENT_ERRORS:]:
+                metrics["last_errors"].appendleft(_json.loads(line))
+        except Exception as e:
+            logger.warning(f"Could not load sync metrics from GCS: {e}")
+        return metrics
+
+    def _load_legacy_metrics(self) -> Dict[str, Any]:
+        """Carga el blob único anterior; la siguiente escritura migra cada sección."""
+        data = get_state(METRICS_STATE_KEY)
+        if not data:
+            return self._empty_metrics()
+        parsed = _json.loads(data) if isinstance(data, (str, bytes)) else data
+        parsed.setdefault("last_sync", {})
+        parsed.setdefault("counters", {})
+        parsed["last_errors"] = deque(
+            parsed.get("last_errors") or [], maxlen=MAX_RECENT_ERRORS
+        )
+        # Migrar todo a los objetos separados en el próximo flush
+        self._pending_errors[:0] = list(reversed(parsed["last_errors"]))
+        self._dirty_sections.update(("counters", "last_sync"))
+        return parsed
+
+    def _save_section(self, section: str) -> bool:
+        """Guarda una sección (counters o last_sync) en su propio objeto."""
+        key = METRICS_COUNTERS_KEY if section == "counters" else METRICS_LAST_SYNC_KEY
+        try:
+            return save_state(key, _json.dumps(self._metrics[section]))
+        except Exception as e:
+            logger.error(f"Failed to save sync metrics ({section}) to GCS: {e}")
+            return False
+
+    def _append_errors(self) -> None:
+        """Agrega los errores pendientes al log JSONL de GCS."""
+        data = b"".join(_json.dumps(entry) + b"\n" for entry in self._pending_errors)
+        components = append_state(METRICS_ERRORS_KEY, data)
+        if components is None:
+            # Se reintenta en el siguiente flush
+            logger.error("Failed to append sync metrics errors to GCS")
+            return
+        self._error_log_lines += len(self._pending_errors)
+        self._error_log_components = components
+        self._pending_errors = []
+        if self._loaded is None:
+            # Ya están en el log: al cargar se leen de ahí
+            self._pending["last_errors"].clear()
+        if (
+            self._error_log_lines >= COMPACT_ERRORS_AFTER_LINES
+            or self._error_log_components >= COMPACT_ERRORS_AFTER_COMPONENTS
+        ):
+            self._compact_errors()
+
+    def _compact_errors(self) -> None:
+        """Reescribe el log de errores con solo los MAX_RECENT_ERRORS más recientes."""
+        recent = list(self._metrics["last_errors"])
+        data = b"".join(_json.dumps(entry) + b"\n" for entry in reversed(recent))
         try:
-            save_state(METRICS_STATE_KEY, json.dumps(self._metrics))
+            if save_state(METRICS_ERRORS_KEY, data):
+                self._error_log_lines = len(recent)
+                self._error_log_components = 1
         except Exception as e:
-            logger.error(f"Failed to save sync metrics to GCS: {e}")
+            logger.error(f"Failed to compact sync metrics errors in GCS: {e}")
+
+    def _mark_dirty(self) -> None:
+        """Registra un cambio pendiente y hace flush si se alcanzó el umbral."""
+        self._dirty_count += 1
+        if (
+            self._dirty_count >= FLUSH_EVERY_OPS
+            or time.monotonic() - self._last_flush >= FLUSH_EVERY_SECONDS
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Escribe a GCS los cambios pendientes (no hace nada si no hay)."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._dirty_count:
+            return
+        # Los errores se agregan sin necesidad de cargar el estado completo
+        if self._pending_errors:
+            self._append_errors()
+        for section in sorted(self._dirty_sections):
+            if self._save_section(section):
+                self._dirty_sections.discard(section)
+        self._dirty_count = 0
+        self._last_flush = time.monotonic()
 
     def record_sync(self, sync_type: str, timestamp: Optional[str] = None) -> None:
         """
@@ -83,10 +246,12 @@ class SyncMetrics:
             timestamp: Timestamp ISO 8601 (default: ahora)
         """
         if timestamp is None:
-            timestamp = dt.datetime.utcnow().isoformat() + "Z"
+            timestamp = _now_iso()
 
-        self._metrics["last_sync"][sync_type] = timestamp
-        self._save_metrics()
+        with self._lock:
+            self._target()["last_sync"][sync_type] = timestamp
+            self._dirty_sections.add("last_sync")
+            self._mark_dirty()
 
     def increment_counter(self, counter_name: str, amount: int = 1) -> None:
         """
@@ -96,9 +261,15 @@ class SyncMetrics:
             counter_name: Nombre del contador
             amount: Cantidad a incrementar
         """
-        current = self._metrics["counters"].get(counter_name, 0)
-        self._metrics["counters"][counter_name] = current + amount
-        self._save_metrics()
+        if not amount:
+            # Una corrida sin cambios no reescribe la sección de contadores;
+            # solo se persiste su last_sync.
+            return
+        with self._lock:
+            counters = self._target()["counters"]
+            counters[counter_name] = counters.get(counter_name, 0) + amount
+            self._dirty_sections.add("counters")
+            self._mark_dirty()
 
     def record_error(
         self,
@@ -117,7 +288,7 @@ class SyncMetrics:
             timestamp: Timestamp ISO 8601 (default: ahora)
         """
         if timestamp is None:
-            timestamp = dt.datetime.utcnow().isoformat() + "Z"
+            timestamp = _now_iso()
 
         error_entry = {
             "timestamp": timestamp,
@@ -128,12 +299,11 @@ class SyncMetrics:
         if entity_id:
             error_entry["entity_id"] = entity_id
 
-        # Mantener solo los últimos 100 errores
-        self._metrics.setdefault("last_errors", [])
-        self._metrics["last_errors"].insert(0, error_entry)
-        self._metrics["last_errors"] = self._metrics["last_errors"][:100]
-
-        self._save_metrics()
+        # El deque conserva solo los últimos MAX_RECENT_ERRORS errores
+        with self._lock:
+            self._target()["last_errors"].appendleft(error_entry)
+            self._pending_errors.append(error_entry)
+            self._mark_dirty()
 
     def get_last_sync(self, sync_type: str) -> Optional[str]:
         """
@@ -178,17 +348,23 @@ class SyncMetrics:
         Returns:
             Lista de errores
         """
-        return self._metrics["last_errors"][:limit]
+        return list(islice(self._metrics["last_errors"], limit))
 
     def reset_counters(self) -> None:
         """Reinicia todos los contadores."""
-        self._metrics["counters"] = {}
-        self._save_metrics()
+        with self._lock:
+            self._metrics["counters"] = {}
+            self._dirty_sections.add("counters")
+            self._dirty_count += 1
+            self.flush()
         logger.info("Sync metrics counters reset")
 
 
 # Instancia singleton
 _metrics_instance: Optional[SyncMetrics] = None
+# Creación protegida: gunicorn corre varios hilos por worker y una segunda
+# instancia perdería los contadores sin flush de la otra.
+_METRICS_INSTANCE_LOCK = threading.Lock()
 
 
 def get_sync_metrics() -> SyncMetrics:
@@ -200,5 +376,15 @@ def get_sync_metrics() -> SyncMetrics:
     """
     global _metrics_instance
     if _metrics_instance is None:
-        _metrics_instance = SyncMetrics()
+        with _METRICS_INSTANCE_LOCK:
+            if _metrics_instance is None:
+                instance = SyncMetrics()
+                atexit.register(instance.flush)
+                _metrics_instance = instance
     return _metrics_instance
+
+
+def flush_sync_metrics() -> None:
+    """Hace flush de la instancia singleton si ya fue creada."""
+    if _metrics_instance is not None:
+        _metrics_instance.flush()
@@ -1,7 +1,8 @@
 """
 Almacenamiento de mapeo ChartHop timeoff ID <-> Runn timeoff ID.
 
-Usa Google Cloud Storage para persistir el mapeo y poder:
+Usa Google Cloud Storage (snapshot JSON + log JSONL de cambios) para persistir
+el mapeo y poder:
 - Actualizar time offs existentes
 - Eliminar time offs específicos
 - Mantener sincronización idempotente
@@ -9,17 +10,52 @@ Usa Google Cloud Storage para persistir el mapeo y poder:
 
 from __future__ import annotations
 
-import json
+import atexit
+import datetime as dt
 import logging
-from typing import Any, Dict, Optional
-
-from app.utils.state_gcs import get_state, save_state
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils import _json
+from app.utils.state_gcs import (
+    append_state,
+    delete_state,
+    get_state_raw_with_generation,
+    save_state,
+)
 
 logger = logging.getLogger(__name__)
 
-# Nombre del archivo de estado en GCS
+# Nombre del archivo de estado en GCS (snapshot completo)
 TIMEOFF_MAPPING_STATE_KEY = "timeoff_mapping.json"
 
+# Log append-only (JSONL) con los cambios posteriores al snapshot. Cada flush
+# agrega solo las operaciones nuevas; compact() reescribe el snapshot y borra
+# el log si nadie lo modificó mientras tanto.
+TIMEOFF_MAPPING_LOG_KEY = "timeoff_mapping.log.jsonl"
+
+# Compactar cuando el log acumula muchas operaciones o muchos componentes
+# (GCS limita un objeto compuesto a 1024 componentes).
+COMPACT_AFTER_OPS = 500
+COMPACT_AFTER_COMPONENTS = 900
+
+_UTC = dt.timezone.utc
+
+
+def _now_iso() -> str:
+    """Timestamp actual en UTC, formato ISO 8601 con sufijo Z."""
+    return dt.datetime.now(_UTC).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+# Las escrituras a GCS se agrupan: se hace flush cada N cambios o cada T segundos
+# (y siempre al final del request / al salir del proceso).
+FLUSH_EVERY_OPS = 20
+FLUSH_EVERY_SECONDS = 2.0
+
+# Lectura del log en paralelo con la del snapshot en la carga inicial
+_LOAD_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timeoff-map-load")
+
 
 class TimeoffMapping:
     """
@@ -42,37 +78,172 @@ class TimeoffMapping:
     """
 
     def __init__(self):
-        self._mapping: Dict[str, Any] = self._load_mapping()
+        self._pending_ops: List[Dict[str, Any]] = []
+        self._log_ops = 0
+        self._log_components = 0
+        # El mapping se carga desde GCS en el primer acceso, no al crear la
+        # instancia: add() solo encola en el log y no necesita el estado completo.
+        self._mapping_data: Optional[Dict[str, Any]] = None
+        self._last_flush = time.monotonic()
+        # Los requests se atienden en varios hilos: flush no debe correr en paralelo
+        self._lock = threading.RLock()
+
+    @property
+    def _mapping(self) -> Dict[str, Any]:
+        """Mapping completo; lo carga (snapshot + log + pendientes) si hace falta."""
+        if self._mapping_data is None:
+            with self._lock:
+                if self._mapping_data is None:
+                    mapping, _ = self._load_mapping()
+                    for op in self._pending_ops:
+                        self._apply_op(mapping, op)
+                    self._mapping_data = mapping
+        return self._mapping_data
+
+    def _load_mapping(self) -> Tuple[Dict[str, Any], Optional[int]]:
+        """
+        Carga el snapshot desde GCS y aplica encima el log de cambios.
 
-    def _load_mapping(self) -> Dict[str, Any]:
-        """Carga el mapping desde GCS."""
+        Returns:
+            (mapping, generación leída del log, o None si el snapshot o el log
+            no se pudieron leer y el mapping puede estar incompleto)
+        """
+        mapping: Dict[str, Any] = {
+            "ch_to_runn": {},
+            "runn_to_ch": {}
+        }
+        # Snapshot y log son objetos independientes: se piden a la vez y el log
+        # se aplica encima del snapshot igual que antes.
+        f_log = _LOAD_EXECUTOR.submit(get_state_raw_with_generation, TIMEOFF_MAPPING_LOG_KEY)
+        snapshot_ok = False
         try:
-            data = get_state(TIMEOFF_MAPPING_STATE_KEY)
-            if data:
-                parsed = json.loads(data) if isinstance(data, str) else data
-                return parsed
+            snapshot = get_state_raw_with_generation(TIMEOFF_MAPPING_STATE_KEY)
+            if snapshot is not None:
+                if snapshot[0]:
+                    mapping = _json.loads(snapshot[0])
+                snapshot_ok = True
         except Exception as e:
             logger.warning(f"Could not load timeoff mapping from GCS: {e}")
 
-        # Estructura por defecto
-        return {
-            "ch_to_runn": {},
-            "runn_to_ch": {}
-        }
+        generation: Optional[int] = None
+        try:
+            read = f_log.result()
+            if read is not None:
+                log, generation = read
+                for line in log.splitlines():
+                    if not line.strip():
+                        continue
+                    self._apply_op(mapping, _json.loads(line))
+                    self._log_ops += 1
+        except Exception as e:
+            generation = None
+            logger.warning(f"Could not replay timeoff mapping log from GCS: {e}")
+
+        return mapping, generation if snapshot_ok else None
 
-    def _save_mapping(self) -> None:
-        """Guarda el mapping a GCS."""
+    @staticmethod
+    def _apply_op(mapping: Dict[str, Any], op: Dict[str, Any]) -> None:
+        """Aplica una operación del log sobre el mapping en memoria."""
+        charthop_id = op.get("ch")
+        if not charthop_id:
+            return
+        if op.get("op") == "add":
+            info = op.get("info") or {}
+            mapping["ch_to_runn"][charthop_id] = info
+            mapping["runn_to_ch"][str(info.get("runn_id"))] = charthop_id
+        elif op.get("op") == "remove":
+            info = mapping["ch_to_runn"].pop(charthop_id, None)
+            if info:
+                mapping["runn_to_ch"].pop(str(info.get("runn_id")), None)
+
+    def _save_mapping(self) -> bool:
+        """Guarda el snapshot completo del mapping a GCS."""
         try:
-            save_state(TIMEOFF_MAPPING_STATE_KEY, json.dumps(self._mapping))
+            return save_state(TIMEOFF_MAPPING_STATE_KEY, _json.dumps(self._mapping))
         except Exception as e:
             logger.error(f"Failed to save timeoff mapping to GCS: {e}")
+            return False
+
+    def _record(self, op: Dict[str, Any]) -> None:
+        """Encola una operación para el log y hace flush si se alcanzó el umbral."""
+        self._pending_ops.append(op)
+        if (
+            len(self._pending_ops) >= FLUSH_EVERY_OPS
+            or time.monotonic() - self._last_flush >= FLUSH_EVERY_SECONDS
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Agrega al log de GCS los cambios pendientes (no hace nada si no hay)."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending_ops:
+            return
+        self._last_flush = time.monotonic()
+
+        if self._log_ops + len(self._pending_ops) >= COMPACT_AFTER_OPS:
+            self.compact()
+            return
+
+        data = b"".join(_json.dumps(op) + b"\n" for op in self._pending_ops)
+        components = append_state(TIMEOFF_MAPPING_LOG_KEY, data)
+        if components is None:
+            # Se reintenta en el siguiente flush
+            logger.error("Failed to append timeoff mapping log to GCS")
+            return
+
+        self._log_ops += len(self._pending_ops)
+        self._log_components = components
+        self._pending_ops = []
+        if self._log_components >= COMPACT_AFTER_COMPONENTS:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Reescribe el snapshot completo y trunca el log de cambios.
+
+        Otras instancias pueden haber agregado operaciones al log desde que esta
+        cargó el mapping: los pendientes propios se agregan primero al log, el
+        snapshot se arma releyendo snapshot + log, y el log solo se borra si
+        sigue en la generación leída. Si cambió, queda para la próxima
+        compactación (reaplicarlo sobre el snapshot nuevo da el mismo estado).
+        """
+        with self._lock:
+            if self._pending_ops:
+                data = b"".join(_json.dumps(op) + b"\n" for op in self._pending_ops)
+                if append_state(TIMEOFF_MAPPING_LOG_KEY, data) is None:
+                    logger.error("Failed to append timeoff mapping log to GCS")
+                    return
+                self._pending_ops = []
+
+            self._log_ops = 0
+            mapping, generation = self._load_mapping()
+            if generation is None:
+                # Sin el log no se puede armar un snapshot completo
+                return
+            self._mapping_data = mapping
+            self._last_flush = time.monotonic()
+            if not self._save_mapping():
+                return
+
+            if generation and not delete_state(
+                TIMEOFF_MAPPING_LOG_KEY, if_generation_match=generation
+            ):
+                logger.info("Timeoff mapping log changed during compaction, kept")
+                return
+            self._log_ops = 0
+            self._log_components = 0
+            logger.info("Timeoff mapping compacted")
 
     def add(
         self,
         charthop_id: str,
         runn_id: int,
         category: str,
-        person_email: str = ""
+        person_email: str = "",
+        synced: Optional[str] = None,
     ) -> None:
         """
         Agrega un mapeo ChartHop ID -> Runn ID.
@@ -82,9 +253,8 @@ class TimeoffMapping:
             runn_id: ID del time off en Runn
             category: Categoría (leave, holidays, rostered-off)
             person_email: Email de la persona (opcional, para debugging)
+            synced: Huella de lo enviado a Runn (ver mark_synced)
         """
-        import datetime as dt
-
         charthop_id = str(charthop_id).strip()
         runn_id = int(runn_id)
 
@@ -92,21 +262,41 @@ class TimeoffMapping:
             logger.warning("Cannot add mapping: charthop_id is empty")
             return
 
-        self._mapping["ch_to_runn"][charthop_id] = {
-            "runn_id": runn_id,
-            "category": category,
-            "person_email": person_email,
-            "created_at": dt.datetime.utcnow().isoformat() + "Z"
+        op = {
+            "op": "add",
+            "ch": charthop_id,
+            "info": {
+                "runn_id": runn_id,
+                "category": category,
+                "person_email": person_email,
+                "created_at": _now_iso()
+            },
         }
-
-        self._mapping["runn_to_ch"][str(runn_id)] = charthop_id
-
-        self._save_mapping()
+        if synced is not None:
+            op["info"]["synced"] = synced
+        with self._lock:
+            if self._mapping_data is not None:
+                self._apply_op(self._mapping_data, op)
+            self._record(op)
 
         logger.info(
             f"Timeoff mapping added: ChartHop {charthop_id} -> Runn {runn_id} ({category})"
         )
 
+    def mark_synced(self, charthop_id: str, synced: str) -> None:
+        """
+        Guarda la huella (fechas + nota) de lo último enviado a Runn para un
+        time off ya mapeado, para saltar updates sin cambios en la próxima corrida.
+        """
+        charthop_id = str(charthop_id).strip()
+        with self._lock:
+            info = self._mapping["ch_to_runn"].get(charthop_id)
+            if not info or info.get("synced") == synced:
+                return
+            op = {"op": "add", "ch": charthop_id, "info": {**info, "synced": synced}}
+            self._apply_op(self._mapping, op)
+            self._record(op)
+
     def get_runn_id(self, charthop_id: str) -> Optional[Dict[str, Any]]:
         """
         Obtiene información del time off en Runn dado el ID de ChartHop.
@@ -144,18 +334,15 @@ class TimeoffMapping:
         """
         charthop_id = str(charthop_id).strip()
 
-        mapping = self._mapping["ch_to_runn"].get(charthop_id)
-        if not mapping:
-            return False
+        with self._lock:
+            mapping = self._mapping["ch_to_runn"].get(charthop_id)
+            if not mapping:
+                return False
 
-        runn_id = str(mapping["runn_id"])
-
-        # Eliminar ambos sentidos del mapeo
-        del self._mapping["ch_to_runn"][charthop_id]
-        if runn_id in self._mapping["runn_to_ch"]:
-            del self._mapping["runn_to_ch"][runn_id]
-
-        self._save_mapping()
+            # Eliminar ambos sentidos del mapeo
+            op = {"op": "remove", "ch": charthop_id}
+            self._apply_op(self._mapping, op)
+            self._record(op)
 
         logger.info(f"Timeoff mapping removed: ChartHop {charthop_id}")
         return True
@@ -179,20 +366,19 @@ class TimeoffMapping:
         Returns:
             Número de mapeos eliminados
         """
-        import datetime as dt
-
-        cutoff = dt.datetime.utcnow() - dt.timedelta(days=days)
+        # created_at siempre es ISO 8601 en UTC con sufijo Z, así que se compara
+        # como string contra el cutoff sin parsear cada entrada.
+        cutoff = dt.datetime.now(_UTC) - dt.timedelta(days=days)
+        cutoff_str = cutoff.isoformat(timespec="seconds").replace("+00:00", "Z")
         to_remove = []
 
         for ch_id, info in self._mapping["ch_to_runn"].items():
-            created_str = info.get("created_at", "")
-            try:
-                created = dt.datetime.fromisoformat(created_str.replace("Z", "+00:00"))
-                if created < cutoff:
-                    to_remove.append(ch_id)
-            except (ValueError, AttributeError):
-                # Si no tiene fecha válida, dejarlo
+            created_str = info.get("created_at")
+            # Si no tiene fecha válida, dejarlo
+            if not isinstance(created_str, str) or not created_str.endswith("Z"):
                 continue
+            if created_str < cutoff_str:
+                to_remove.append(ch_id)
 
         for ch_id in to_remove:
             self.remove(ch_id)
@@ -205,6 +391,9 @@ class TimeoffMapping:
 
 # Instancia singleton
 _mapping_instance: Optional[TimeoffMapping] = None
+# Con varios hilos por worker, dos requests simultáneos no deben crear cada uno
+# su propia instancia (los cambios sin flush de una se perderían).
+_MAPPING_INSTANCE_LOCK = threading.Lock()
 
 
 def get_timeoff_mapping() -> TimeoffMapping:
@@ -216,5 +405,15 @@ def get_timeoff_mapping() -> TimeoffMapping:
     """
     global _mapping_instance
     if _mapping_instance is None:
-        _mapping_instance = TimeoffMapping()
+        with _MAPPING_INSTANCE_LOCK:
+            if _mapping_instance is None:
+                instance = TimeoffMapping()
+                atexit.register(instance.flush)
+                _mapping_instance = instance
     return _mapping_instance
+
+
+def flush_timeoff_mapping() -> None:
+    """Hace flush de la instancia singleton si ya fue creada."""
+    if _mapping_instance is not None:
+        _mapping_instance.flush()
@@ -0,0 +1,49 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("requests")
+
+from requests.exceptions import HTTPError  # noqa: E402
+
+from app.clients import charthop  # noqa: E402
+
+
+def _response(status_code, content=b"{}", headers=None):
+    resp = mock.Mock(status_code=status_code, content=content, headers=headers or {})
+    if status_code >= 400:
+        resp.raise_for_status.side_effect = HTTPError(f"{status_code}", response=resp)
+    return resp
+
+
+def test_retry_after_is_honored_and_capped():
+    with mock.patch.object(charthop.random, "uniform", return_value=1.0):
+        assert charthop._retry_delay(1, _response(429, headers={"Retry-After": "7"})) == 7.0
+        assert (
+            charthop._retry_delay(1, _response(429, headers={"Retry-After": "3600"}))
+            == charthop._MAX_RETRY_AFTER_SECONDS
+        )
+        assert charthop._retry_delay(1, _response(429, headers={"Retry-After": "soon"})) == 1.0
+
+
+def test_get_json_retries_429_with_retry_after():
+    session = mock.Mock()
+    session.get.side_effect = [
+        _response(429, headers={"Retry-After": "3600"}),
+        _response(200, content=b'{"data": [1]}'),
+    ]
+    with mock.patch.object(charthop.time, "sleep") as sleep:
+        assert charthop._get_json(session, "https://ch.test/x", {}) == {"data": [1]}
+    assert session.get.call_count == 2
+    sleep.assert_called_once_with(charthop._MAX_RETRY_AFTER_SECONDS)
+
+
+def test_get_json_raises_404_without_retrying():
+    session = mock.Mock()
+    session.get.return_value = _response(404)
+    with mock.patch.object(charthop.time, "sleep") as sleep:
+        with pytest.raises(HTTPError) as excinfo:
+            charthop._get_json(session, "https://ch.test/x", {})
+    assert excinfo.value.response.status_code == 404
+    assert session.get.call_count == 1
+    sleep.assert_not_called()
@@ -0,0 +1,36 @@
+import threading
+import time
+
+from app.utils.rate_limiter import RateLimiter
+
+
+def test_low_quota_paces_concurrent_waiters():
+    limiter = RateLimiter(max_requests=1000, window_seconds=60)
+    # 3 restantes y reset en 0.4s: un turno cada 0.1s
+    limiter.observe_headers({"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "0.4"})
+
+    started = time.time()
+    sent = []
+
+    def send():
+        limiter.wait_if_needed()
+        sent.append(time.time() - started)
+
+    threads = [threading.Thread(target=send) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sent.sort()
+    assert all(later - earlier >= 0.09 for earlier, later in zip(sent, sent[1:]))
+
+
+def test_recovered_quota_stops_pacing():
+    limiter = RateLimiter(max_requests=1000, window_seconds=60)
+    limiter.observe_headers({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0.05"})
+    limiter.wait_if_needed()
+    limiter.observe_headers({"X-RateLimit-Remaining": "50", "X-RateLimit-Reset": "30"})
+
+    time.sleep(0.06)
+    assert limiter.wait_if_needed() == 0.0
@@ -0,0 +1,67 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("requests")
+
+from flask import Flask  # noqa: E402
+
+from app.blueprints import teamtailor_webhook as tt  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(tt.bp_tt)
+    tt._RECENT_HIRES.clear()
+    with mock.patch.object(tt, "tt_verify_signature", return_value=True), mock.patch.object(
+        tt, "tt_fetch_application", return_value=mock.Mock(ok=True, status_code=200, content=b"{}")
+    ):
+        yield app.test_client()
+    tt._RECENT_HIRES.clear()
+
+
+def _deliver(client, rid="app-1"):
+    return client.post("/webhooks/teamtailor", json={"resource_id": rid})
+
+
+def test_failed_charthop_import_allows_redelivery(client):
+    failed = {
+        "processed": False,
+        "reason": "charthop import failed",
+        "chartHopImport": {"error": "timeout"},
+    }
+    ok = {"processed": True, "chartHopImport": {"submitted": True}}
+    with mock.patch.object(tt, "process_hired_application", side_effect=[failed, ok]) as process:
+        assert _deliver(client).status_code == 200
+        assert _deliver(client).status_code == 200
+    assert process.call_count == 2
+
+
+def test_imported_hire_skips_redelivery(client):
+    ok = {"processed": True, "chartHopImport": {"submitted": True}}
+    with mock.patch.object(tt, "process_hired_application", return_value=ok) as process:
+        assert _deliver(client).status_code == 200
+        assert _deliver(client).status_code == 200
+    assert process.call_count == 1
+
+
+def test_pending_charthop_import_keeps_claim_until_it_fails(client):
+    pending = {
+        "processed": False,
+        "reason": "charthop import failed",
+        "chartHopImport": {"error": "timeout"},
+        "chartHopPending": True,
+    }
+    ok = {"processed": True, "chartHopImport": {"submitted": True}}
+    with mock.patch.object(tt, "process_hired_application", side_effect=[pending, ok]) as process:
+        assert _deliver(client).status_code == 200
+        # El import sigue en curso: la reentrega no vuelve a importar
+        assert _deliver(client).status_code == 200
+        assert process.call_count == 1
+
+        # El import termina con error: se libera y la reentrega se procesa
+        process.call_args.kwargs["on_import_failed"]()
+        assert _deliver(client).status_code == 200
+    assert process.call_count == 2
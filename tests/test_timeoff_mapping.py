@@ -0,0 +1,98 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("google.cloud.storage")
+
+from app.utils import _json  # noqa: E402
+from app.utils import timeoff_mapping as tm  # noqa: E402
+
+
+class FakeBucket:
+    """Objetos de estado en memoria con generaciones, como en GCS."""
+
+    def __init__(self):
+        self.objects = {}
+        self._generation = 0
+
+    def _put(self, key, data):
+        self._generation += 1
+        self.objects[key] = (bytes(data), self._generation)
+
+    def get_state_raw_with_generation(self, key):
+        return self.objects.get(key, (b"", 0))
+
+    def save_state(self, key, data):
+        self._put(key, data)
+        return True
+
+    def append_state(self, key, data):
+        current = self.objects.get(key, (b"", 0))[0]
+        self._put(key, current + data)
+        return 1
+
+    def delete_state(self, key, if_generation_match=None):
+        if key not in self.objects:
+            return if_generation_match is None
+        if if_generation_match is not None and self.objects[key][1] != if_generation_match:
+            return False
+        del self.objects[key]
+        return True
+
+    def snapshot(self):
+        return _json.loads(self.objects[tm.TIMEOFF_MAPPING_STATE_KEY][0])["ch_to_runn"]
+
+
+@pytest.fixture
+def bucket():
+    fake = FakeBucket()
+    with mock.patch.multiple(
+        tm,
+        get_state_raw_with_generation=fake.get_state_raw_with_generation,
+        save_state=fake.save_state,
+        append_state=fake.append_state,
+        delete_state=fake.delete_state,
+    ):
+        yield fake
+
+
+def _op(ch_id, runn_id):
+    return _json.dumps({"op": "add", "ch": ch_id, "info": {"runn_id": runn_id, "category": "leave"}}) + b"\n"
+
+
+def test_compact_keeps_ops_appended_by_other_instances(bucket):
+    mapping = tm.TimeoffMapping()
+    mapping.add("ch-1", 1, "leave")
+    assert mapping.get_runn_id("ch-1")["runn_id"] == 1
+
+    # Otra instancia agrega al log después de que esta cargó el mapping
+    bucket.append_state(tm.TIMEOFF_MAPPING_LOG_KEY, _op("ch-2", 2))
+
+    mapping.compact()
+
+    assert set(bucket.snapshot()) == {"ch-1", "ch-2"}
+    assert tm.TIMEOFF_MAPPING_LOG_KEY not in bucket.objects
+    assert mapping.get_runn_id("ch-2")["runn_id"] == 2
+
+
+def test_compact_keeps_log_that_changed_after_it_was_read(bucket):
+    mapping = tm.TimeoffMapping()
+    mapping.add("ch-1", 1, "leave")
+
+    save_state = bucket.save_state
+
+    def save_then_other_instance_appends(key, data):
+        saved = save_state(key, data)
+        bucket.append_state(tm.TIMEOFF_MAPPING_LOG_KEY, _op("ch-3", 3))
+        return saved
+
+    with mock.patch.object(tm, "save_state", save_then_other_instance_appends):
+        mapping.compact()
+
+    # El log no se borró: la op de la otra instancia sigue ahí
+    log = bucket.objects[tm.TIMEOFF_MAPPING_LOG_KEY][0]
+    assert b'"ch-3"' in log
+
+    fresh = tm.TimeoffMapping()
+    assert fresh.get_runn_id("ch-1")["runn_id"] == 1
+    assert fresh.get_runn_id("ch-3")["runn_id"] == 3
@@ -11,12 +11,18 @@ Usage:
     python3 tools/check_job_comp.py JOB_ID
     # or
     JOB_ID=670405b2c8e3d13247cfef5d python3 tools/check_job_comp.py
+    # or several jobs at once (prints a JSON array; "-" reads ids from stdin)
+    python3 tools/check_job_comp.py JOB_ID_1 JOB_ID_2
+    cut -d, -f1 jobs.csv | python3 tools/check_job_comp.py -
 """
 
 import json
 import os
 import sys
 
+# Flat fee per hiring scheme (normalized to lowercase); any other scheme has no fee
+_FEE_BY_SCHEME = {"ontop": 720, "voiz": 240}
+
 
 def calculate_ctc(base: float, esquema: str) -> float:
     """
@@ -39,61 +45,31 @@ def calculate_ctc(base: float, esquema: str) -> float:
     if not base:
         return 0.0
 
-    # Normalize esquema
-    esquema_normalized = (esquema or "").strip().lower()
+    # Determine fee based on the normalized esquema
+    fee = _FEE_BY_SCHEME.get((esquema or "").strip().lower(), 0)
 
-    # Determine fee based on esquema
-    if esquema_normalized == "ontop":
-        fee = 720
-    elif esquema_normalized == "voiz":
-        fee = 240
-    else:
-        fee = 0
+    return round(base + fee, 2)
 
-    # Calculate CTC
-    ctc = base + fee
 
-    return round(ctc, 2)
+def _read_job_ids() -> list:
+    """Job IDs from argv ("-" reads whitespace-separated ids from stdin) or JOB_ID."""
+    args = [arg.strip() for arg in sys.argv[1:] if arg.strip()]
+    if args == ["-"]:
+        args = sys.stdin.read().split()
+    elif not args:
+        args = [os.getenv("JOB_ID", "").strip()]
+    return [job_id for job_id in args if job_id]
 
 
-def main():
-    # Get job ID from command line argument or environment variable
-    job_id = None
-    if len(sys.argv) > 1:
-        job_id = sys.argv[1].strip()
-    else:
-        job_id = os.getenv("JOB_ID", "").strip()
-
-    if not job_id:
-        print("Error: JOB_ID required. Provide as argument or environment variable.", file=sys.stderr)
-        print(__doc__, file=sys.stderr)
-        sys.exit(1)
-
-    # Verify required environment variables
-    required_vars = ["CH_API", "CH_ORG_ID", "CH_API_TOKEN"]
-    missing = [var for var in required_vars if not os.getenv(var)]
-    if missing:
-        print(f"Error: Missing required environment variables: {', '.join(missing)}", file=sys.stderr)
-        sys.exit(1)
-
-    # Import after env vars are validated (module needs them at import time)
-    try:
-        from app.clients.charthop import ch_get_job_compensation_fields
-    except ImportError as e:
-        print(f"Error importing ch_get_job_compensation_fields: {e}", file=sys.stderr)
-        print("Make sure PYTHONPATH includes the repo root.", file=sys.stderr)
-        sys.exit(1)
-
-    # Fetch job compensation fields
-    try:
-        data = ch_get_job_compensation_fields(job_id)
-    except Exception as e:
-        print(f"Error fetching job compensation fields: {e}", file=sys.stderr)
-        sys.exit(1)
+def check_job(job_id: str, fetch) -> dict:
+    """Fetch one job's compensation fields and compute its CTC.
 
+    Raises:
+        ValueError: if the job returns no data or an invalid base value
+    """
+    data = fetch(job_id)
     if not data:
-        print(f"Error: No data returned for job {job_id}", file=sys.stderr)
-        sys.exit(1)
+        raise ValueError(f"No data returned for job {job_id}")
 
     # Extract fields
     base = data.get("base")
@@ -116,14 +92,12 @@ def main():
             base_float = float(base)
             ctc = calculate_ctc(base_float, esquema_str or "")
         except (ValueError, TypeError):
-            print(f"Error: Invalid base value: {base}", file=sys.stderr)
-            sys.exit(1)
+            raise ValueError(f"Invalid base value: {base}")
     else:
         base_float = None
         ctc = None
 
-    # Build result
-    result = {
+    return {
         "base": base_float,
         "scheme": esquema_str,
         "currency": currency,
@@ -131,8 +105,60 @@ def main():
         "ctc": ctc,
     }
 
-    # Print JSON result
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+def main():
+    # Get job IDs from command line arguments, stdin or environment variable
+    job_ids = _read_job_ids()
+
+    if not job_ids:
+        print("Error: JOB_ID required. Provide as argument or environment variable.", file=sys.stderr)
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+    # Verify required environment variables
+    required_vars = ["CH_API", "CH_ORG_ID", "CH_API_TOKEN"]
+    missing = [var for var in required_vars if not os.getenv(var)]
+    if missing:
+        print(f"Error: Missing required environment variables: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+    # Import after env vars are validated (module needs them at import time)
+    try:
+        from app.clients.charthop import ch_get_job_compensation_fields
+    except ImportError as e:
+        print(f"Error importing ch_get_job_compensation_fields: {e}", file=sys.stderr)
+        print("Make sure PYTHONPATH includes the repo root.", file=sys.stderr)
+        sys.exit(1)
+
+    if len(job_ids) == 1:
+        try:
+            result = check_job(job_ids[0], ch_get_job_compensation_fields)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error fetching job compensation fields: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        # Print JSON result
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return
+
+    # Batch mode: every request reuses the client's shared session (one TLS
+    # handshake for the whole run) and repeated ids are only fetched once.
+    cache = {}
+    results = []
+    for job_id in job_ids:
+        if job_id not in cache:
+            try:
+                cache[job_id] = check_job(job_id, ch_get_job_compensation_fields)
+            except Exception as e:
+                cache[job_id] = {"error": str(e)}
+        results.append({"job_id": job_id, **cache[job_id]})
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if any("error" in result for result in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":